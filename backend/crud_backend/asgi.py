@@ -6,7 +6,7 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 import os
 
-from django.core.asgi import get_asgi_application
+from users.handlers import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crud_backend.settings')
 
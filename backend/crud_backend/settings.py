@@ -46,7 +46,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'users.timing.ServerTimingMiddleware',
+    'users.metrics.MetricsMiddleware',
     'users.security_middleware.SecurityHeadersMiddleware',
+    'users.throttling.RateLimitHeadersMiddleware',
     'users.middleware.RequestValidationMiddleware',  # Re-enabled with improvements
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -57,6 +60,24 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Middleware skipped per URL prefix (see users.handlers). API clients
+# authenticate with API keys, so /api/ needs no session or CSRF machinery;
+# everything else, including /admin/, runs the full MIDDLEWARE stack.
+MIDDLEWARE_PROFILES = {
+    '/api/': [
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ],
+}
+
+# Serve the user list/detail GETs with the async views in users.async_views.
+# Only worth enabling under ASGI (SERVER_MODE=asgi in docker-entrypoint.sh);
+# a WSGI worker would have to start an event loop for every request.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 ROOT_URLCONF = 'crud_backend.urls'
 
 TEMPLATES = [
@@ -153,9 +174,13 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'users.parsers.PreparsedJSONParser',
+        'users.parsers.LimitedFormParser',
+        'users.parsers.StreamingMultiPartParser',
+    ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'users.throttling.RateLimitThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
@@ -215,6 +240,13 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000  # Maximum number of fields in request
 DATA_UPLOAD_MAX_NUMBER_FILES = 10  # Maximum number of files in request
 
+# Streaming multipart upload validation (users.upload_handlers)
+UPLOAD_SETTINGS = {
+    'MAX_FILE_SIZE': 5 * 1024 * 1024,  # 5MB per file
+    'MAX_TOTAL_SIZE': 10 * 1024 * 1024,  # 10MB across all files in a request
+    'ALLOWED_MIME_TYPES': ['image/jpeg', 'image/png', 'image/gif', 'image/webp'],
+}
+
 # Content Security Policy
 CSP_DEFAULT_SRC = ["'self'"]
 CSP_SCRIPT_SRC = ["'self'", "'unsafe-inline'"]
@@ -227,6 +259,7 @@ INPUT_VALIDATION = {
     'MAX_STRING_LENGTH': 1000,
     'MAX_TEXT_LENGTH': 5000,
     'MAX_JSON_SIZE': 10 * 1024,  # 10KB
+    'MAX_DATA_SIZE': 1024 * 1024,  # 1MB of non-file request data, enforced by users.parsers
     'ALLOWED_IMAGE_TYPES': ['jpeg', 'jpg', 'png', 'gif', 'webp'],
     'MAX_IMAGE_SIZE': 5 * 1024 * 1024,  # 5MB
     'MAX_IMAGE_DIMENSIONS': (2048, 2048),
@@ -234,10 +267,46 @@ INPUT_VALIDATION = {
     'STRIP_DANGEROUS_CONTENT': True,
 }
 
+# POST /api/users/bulk/ (users.views.UserBulkCreateView)
+BULK_CREATE_SETTINGS = {
+    'MAX_RECORDS': 500,  # Rows per request; also bounded by the JSON node budget
+    'BATCH_SIZE': 100,  # Rows per INSERT statement
+}
+
+# Disposable email domains rejected by CustomEmailValidator (users.blocklist)
+EMAIL_BLOCKLIST_SETTINGS = {
+    'PATH': config('EMAIL_BLOCKLIST_PATH', default=''),  # One domain per line; empty uses the built-in list only
+    'RELOAD_INTERVAL': 30,  # Seconds between checks of the file for changes
+}
+
+# Repeat-offender bans applied by RequestValidationMiddleware
+OFFENDER_SETTINGS = {
+    'STRIKE_THRESHOLD': 10,  # Rejected requests per IP before it is banned
+    'STRIKE_WINDOW': 600,  # Seconds over which strikes are counted
+    'BAN_BASE_SECONDS': 60,  # First ban; each further ban doubles it
+    'BAN_MAX_SECONDS': 24 * 3600,
+    'BAN_MEMORY': 7 * 24 * 3600,  # Seconds a ban still counts towards the next one
+    # Header the trusted proxy overwrites with the client address (nginx sets
+    # X-Real-IP); None keys on REMOTE_ADDR. Never X-Forwarded-For, which clients can forge.
+    'CLIENT_IP_HEADER': config('CLIENT_IP_HEADER', default='HTTP_X_REAL_IP') or None,
+}
+
 # Rate limiting for requests
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
 
+# Rate limiting engine used by APIKeyRateLimit
+RATE_LIMIT_SETTINGS = {
+    'BACKEND': 'users.rate_limiting.LocalRateLimitBackend',
+    'ALGORITHM': 'sliding_window',  # 'sliding_window' or 'token_bucket'
+    'WINDOW': 3600,  # Seconds covered by APIKey.rate_limit
+    'REDIS_URL': config('REDIS_URL', default='redis://localhost:6379/1'),
+    'LEASE_SIZE': 50,  # Tokens a worker reserves per shared-store round trip (0 disables)
+    'LEASE_TTL': 10,  # Seconds before unused leased tokens are returned
+    'LEASE_MIN_LIMIT': 10000,  # Only keys with at least this hourly limit use leases
+    'CONCURRENCY_LEASE_TTL': 60,  # Seconds before an abandoned concurrency slot expires
+}
+
 API_KEY_SETTINGS = {
     'DEFAULT_RATE_LIMIT': 1000,  # requests per hour
     'DEFAULT_PERMISSIONS': {
@@ -247,6 +316,19 @@ API_KEY_SETTINGS = {
     'ENFORCE_RATE_LIMITS': True,
     'MAX_KEYS_PER_NAME': 1,
     'KEY_EXPIRY_DAYS': 365,  # Optional key expiry
+    'AUTH_CACHE_TTL': 300,  # Seconds a resolved key stays in the shared cache
+    'AUTH_LOCAL_CACHE_TTL': 30,  # Seconds a resolved key stays in the per-worker LRU
+    'AUTH_LOCAL_CACHE_SIZE': 1024,  # Max keys held in the per-worker LRU
+    'NEGATIVE_CACHE_TTL': 30,  # Seconds an unknown prefix / failed key hash is remembered
+    'FAILED_AUTH_THRESHOLD': 20,  # Failed authentications per IP before it is rejected
+    'FAILED_AUTH_WINDOW': 300,  # Seconds over which failed authentications are counted
+    'LAST_USED_FLUSH_INTERVAL': 60,  # Seconds of last_used accuracy (0 = write every request)
+}
+
+# Prometheus scrape endpoint (users.metrics). Prometheus sends the token as
+# a bearer credential; with none configured /metrics refuses every request
+METRICS_SETTINGS = {
+    'SCRAPE_TOKEN': config('METRICS_SCRAPE_TOKEN', default=''),
 }
 
 # Add custom security middleware for additional headers
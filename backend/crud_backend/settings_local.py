@@ -43,6 +43,13 @@ CACHES = {
     }
 }
 
+# Shared, atomic rate limiting across workers
+RATE_LIMIT_SETTINGS = {
+    **RATE_LIMIT_SETTINGS,
+    'BACKEND': 'users.rate_limiting.RedisRateLimitBackend',
+    'REDIS_URL': 'redis://redis:6379/1',
+}
+
 # Email
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -42,6 +42,13 @@ CACHES = {
     }
 }
 
+# Shared, atomic rate limiting across workers
+RATE_LIMIT_SETTINGS = {
+    **RATE_LIMIT_SETTINGS,
+    'BACKEND': 'users.rate_limiting.RedisRateLimitBackend',
+    'REDIS_URL': config('REDIS_URL', default='redis://localhost:6379/1'),
+}
+
 # Session engine using cache
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
@@ -13,12 +13,30 @@ echo "PostgreSQL is ready!"
 echo "Applying database migrations..."
 python manage.py migrate
 
-# Start the server
-echo "Starting Gunicorn server..."
-exec gunicorn crud_backend.wsgi:application \
+# Workers share metrics through files in this directory; values left over
+# from a previous run must not be merged into the new one
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+
+# Start the server. SERVER_MODE=asgi runs uvicorn workers, where one worker
+# serves many slow clients concurrently and the user list/detail GETs are
+# handled by async views; the default is threaded WSGI workers.
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+  echo "Starting Gunicorn server (ASGI)..."
+  export ASYNC_VIEWS=${ASYNC_VIEWS:-True}
+  APPLICATION=crud_backend.asgi:application
+  WORKER_CLASS=uvicorn.workers.UvicornWorker
+else
+  echo "Starting Gunicorn server..."
+  APPLICATION=crud_backend.wsgi:application
+  WORKER_CLASS=${GUNICORN_WORKER_CLASS:-gthread}
+fi
+
+exec gunicorn ${APPLICATION} \
     --bind 0.0.0.0:8000 \
     --workers=${GUNICORN_WORKERS:-4} \
-    --worker-class=${GUNICORN_WORKER_CLASS:-gthread} \
+    --worker-class=${WORKER_CLASS} \
     --threads=${GUNICORN_THREADS:-2} \
     --worker-connections=${GUNICORN_WORKER_CONNECTIONS:-1000} \
     --max-requests=${GUNICORN_MAX_REQUESTS:-1000} \
@@ -0,0 +1,12 @@
+"""
+Gunicorn settings read from the working directory on startup; the command
+line flags in docker-entrypoint.sh configure everything else.
+"""
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Counters and histograms of an exited worker are kept; its live gauge
+    # values are dropped
+    multiprocess.mark_process_dead(worker.pid)
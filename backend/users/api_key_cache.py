@@ -0,0 +1,219 @@
+"""
+Two-level resolution cache for API key authentication
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import record_cache_lookup
+
+
+def get_api_key_setting(name, default):
+    """Read a value from the API_KEY_SETTINGS dict with a fallback"""
+    return getattr(settings, 'API_KEY_SETTINGS', {}).get(name, default)
+
+
+class LocalTTLCache:
+    """
+    Thread-safe, per-worker LRU cache whose entries expire after a fixed TTL.
+    """
+
+    def __init__(self, max_size=1024, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class APIKeyCache:
+    """
+    Resolves a presented API key to its APIKey record without touching the
+    database on the hot path.
+
+    Level 1 is a per-worker LRU with a short TTL, level 2 is the shared Django
+    cache. Both are keyed by the SHA-256 hash of the presented key, which is
+    the same value stored in ``APIKey.key_hash``, so invalidation only needs
+    the model instance.
+    """
+
+    CACHE_KEY_PREFIX = 'api_key_auth:v2'
+    NEGATIVE_KEY_PREFIX = 'api_key_auth_miss'
+
+    def __init__(self):
+        self._local = None
+        self._local_lock = threading.Lock()
+
+    @property
+    def local(self):
+        if self._local is None:
+            with self._local_lock:
+                if self._local is None:
+                    self._local = LocalTTLCache(
+                        max_size=get_api_key_setting('AUTH_LOCAL_CACHE_SIZE', 1024),
+                        ttl=get_api_key_setting('AUTH_LOCAL_CACHE_TTL', 30),
+                    )
+        return self._local
+
+    def _cache_key(self, key_hash):
+        return f"{self.CACHE_KEY_PREFIX}:{key_hash}"
+
+    def get(self, key_hash):
+        """Return a fresh APIKey instance for the hash, or None on a miss"""
+        snapshot = self.local.get(key_hash)
+        record_cache_lookup('api_key_local', snapshot is not None)
+        if snapshot is None:
+            snapshot = cache.get(self._cache_key(key_hash))
+            record_cache_lookup('api_key_shared', snapshot is not None)
+            if snapshot is None:
+                return None
+            self.local.set(key_hash, snapshot)
+
+        return self._from_snapshot(snapshot)
+
+    def set(self, api_key_obj):
+        """Store a verified, active API key under its hash"""
+        snapshot = self._to_snapshot(api_key_obj)
+        cache.set(
+            self._cache_key(api_key_obj.key_hash),
+            snapshot,
+            timeout=get_api_key_setting('AUTH_CACHE_TTL', 300)
+        )
+        self.local.set(api_key_obj.key_hash, snapshot)
+
+    def invalidate(self, key_hash):
+        """Drop a key from both levels of this worker's view"""
+        if not key_hash:
+            return
+        cache.delete(self._cache_key(key_hash))
+        self.local.delete(key_hash)
+
+    def _negative_keys(self, key_hash, prefix=None):
+        keys = [f"{self.NEGATIVE_KEY_PREFIX}:hash:{key_hash}"]
+        if prefix:
+            keys.append(f"{self.NEGATIVE_KEY_PREFIX}:prefix:{prefix}")
+        return keys
+
+    def mark_invalid(self, key_hash, reason, prefix=None):
+        """
+        Remember a failed lookup and its reason for NEGATIVE_CACHE_TTL
+        seconds. Pass the prefix only when no key with that prefix exists.
+
+        Failures live in the shared cache only, never in the per-worker LRU,
+        so clear_invalid takes effect in every worker at once.
+        """
+        keys = self._negative_keys(key_hash, prefix)
+        cache.set_many(
+            {key: reason for key in keys},
+            timeout=get_api_key_setting('NEGATIVE_CACHE_TTL', 30)
+        )
+
+    def get_invalid_reason(self, key_hash, prefix=None):
+        """Reason this hash (or its unknown prefix) recently failed, or None"""
+        found = cache.get_many(self._negative_keys(key_hash, prefix))
+        return next(iter(found.values()), None)
+
+    def clear_invalid(self, key_hash, prefix=None):
+        """Forget failed lookups, e.g. after a key with this prefix is created"""
+        cache.delete_many(self._negative_keys(key_hash, prefix))
+
+    def clear_local(self):
+        self.local.clear()
+
+    def _to_snapshot(self, api_key_obj):
+        fields = {
+            field.attname: getattr(api_key_obj, field.attname)
+            for field in api_key_obj._meta.concrete_fields
+        }
+        # Permission bitmasks are compiled once and cached with the key
+        return fields, api_key_obj.permission_masks
+
+    def _from_snapshot(self, snapshot):
+        from .models import APIKey
+
+        # Each request gets its own instance, with its own copies of the
+        # JSON values, so per-request mutations (e.g. last_used or edits to
+        # permissions) never leak into the cached snapshot.
+        fields, permission_masks = snapshot
+        field_names = list(fields.keys())
+        values = [
+            copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+            for value in (fields[name] for name in field_names)
+        ]
+        api_key_obj = APIKey.from_db('default', field_names, values)
+        api_key_obj._compiled_permissions = (api_key_obj.permissions, dict(permission_masks))
+        return api_key_obj
+
+
+class AuthFailureTracker:
+    """
+    Counts failed API key authentications per client IP in the shared
+    cache. Once FAILED_AUTH_THRESHOLD failures happen within
+    FAILED_AUTH_WINDOW seconds the IP is rejected before any DB lookup.
+    """
+
+    CACHE_KEY_PREFIX = 'auth_failures'
+
+    def _cache_key(self, ip):
+        return f"{self.CACHE_KEY_PREFIX}:{ip}"
+
+    @property
+    def window(self):
+        return get_api_key_setting('FAILED_AUTH_WINDOW', 300)
+
+    def record(self, ip):
+        if not ip:
+            return
+        key = self._cache_key(ip)
+        if not cache.add(key, 1, timeout=self.window):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, timeout=self.window)
+
+    def is_blocked(self, ip):
+        if not ip:
+            return False
+        threshold = get_api_key_setting('FAILED_AUTH_THRESHOLD', 20)
+        return cache.get(self._cache_key(ip), 0) >= threshold
+
+    def reset(self, ip):
+        cache.delete(self._cache_key(ip))
+
+
+api_key_cache = APIKeyCache()
+auth_failure_tracker = AuthFailureTracker()
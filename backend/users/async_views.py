@@ -0,0 +1,134 @@
+"""
+Async user endpoints for ASGI deployments.
+
+Under ASGI a sync DRF view holds a worker thread for the whole request. The
+views here serve GET natively instead: the DRF view's own authentication,
+permission, throttle and concurrency checks run in one thread hop, the rows
+are fetched with the async ORM and the response is rendered on the event
+loop. Writes are handed to the regular DRF views, so validation and upload
+handling stay in one place.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.http import Http404, HttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .models import User
+from .rate_limiting import get_rate_limiter
+from .timing import timed
+from .views import CustomPagination, UserDetailView, UserListCreateView
+
+
+class AsyncPagination(CustomPagination):
+    """CustomPagination whose count and page rows come from the async ORM"""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is cached; filling it in keeps page() off the sync ORM
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        self.request = request
+        return self.page.object_list
+
+
+def _render(view, request, response):
+    """
+    Finalize and render a DRF response into a plain HttpResponse, so the
+    async handler does not hop to a thread to render it.
+    """
+    response = view.finalize_response(request, response)
+    with timed('render'):
+        response.render()
+    rendered = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        rendered[header] = value
+    return rendered
+
+
+def _enter(view, request, args, kwargs):
+    """Run the DRF view's authentication, permission and throttle checks"""
+    view.args = args
+    view.kwargs = kwargs
+    view._concurrency_slot = None
+    request = view.initialize_request(request, *args, **kwargs)
+    view.request = request
+    view.headers = view.default_response_headers
+    try:
+        view.initial(request, *args, **kwargs)
+    except Exception as exc:
+        return request, view.handle_exception(exc)
+    return request, None
+
+
+def async_read_view(view_class, read):
+    """
+    Build an async view that serves GET with the ``read`` coroutine and
+    every other method with ``view_class``'s regular DRF view.
+    """
+    sync_view = sync_to_async(view_class.as_view())
+
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await sync_view(request, *args, **kwargs)
+
+        drf_view = view_class()
+        drf_view.setup(request, *args, **kwargs)
+        drf_request, response = await sync_to_async(_enter)(drf_view, request, args, kwargs)
+        try:
+            if response is None:
+                try:
+                    response = await read(drf_view, drf_request, **kwargs)
+                except Exception as exc:
+                    response = drf_view.handle_exception(exc)
+            return _render(drf_view, drf_request, response)
+        finally:
+            if drf_view._concurrency_slot is not None:
+                await sync_to_async(get_rate_limiter().release_slot)(*drf_view._concurrency_slot)
+
+    # API clients authenticate with API keys, like the DRF views
+    view.csrf_exempt = True
+    view.view_class = view_class
+    return view
+
+
+async def list_users(view, request):
+    """Same response as UserListCreateView.list"""
+    queryset = view.filter_queryset(view.get_queryset())
+    paginator = AsyncPagination()
+    page = await paginator.apaginate_queryset(queryset, request, view=view)
+    serializer = view.get_serializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+async def retrieve_user(view, request, pk):
+    """Same response as UserDetailView.retrieve"""
+    try:
+        instance = await view.get_queryset().aget(pk=pk)
+    except User.DoesNotExist:
+        raise Http404('No User matches the given query.')
+    view.check_object_permissions(request, instance)
+    serializer = view.get_serializer(instance)
+    return Response({
+        'message': 'User retrieved successfully',
+        'user': serializer.data
+    })
+
+
+user_list_create = async_read_view(UserListCreateView, list_users)
+user_detail = async_read_view(UserDetailView, retrieve_user)
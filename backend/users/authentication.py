@@ -1,8 +1,59 @@
 from rest_framework.authentication import BaseAuthentication
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, Throttled
 from django.utils import timezone
 from .models import APIKey
-import hashlib
+from .api_key_cache import api_key_cache, auth_failure_tracker
+from .offenders import get_client_ip
+from .usage_tracking import last_used_buffer
+from .rate_limiting import get_rate_limiter
+from .timing import timed
+
+
+RESOLVE_BLOCKED = 'blocked'
+RESOLVE_NOT_FOUND = 'not_found'
+RESOLVE_INVALID = 'invalid'
+
+
+def resolve_api_key(api_key, client_ip=None):
+    """
+    Resolve a presented API key to an active APIKey.
+
+    Returns ``(api_key_obj, None)`` on success or ``(None, reason)`` where
+    reason is one of RESOLVE_BLOCKED, RESOLVE_NOT_FOUND or RESOLVE_INVALID.
+    Cached keys cost no DB query; recently failed keys and IPs with too
+    many failures are rejected before the DB is touched.
+    """
+    key_hash = APIKey.hash_key(api_key)
+    api_key_obj = api_key_cache.get(key_hash)
+    if api_key_obj is not None:
+        return api_key_obj, None
+    
+    if auth_failure_tracker.is_blocked(client_ip):
+        return None, RESOLVE_BLOCKED
+    
+    # Get the prefix to find the API key record
+    prefix = api_key[:8]
+    
+    reason = api_key_cache.get_invalid_reason(key_hash, prefix)
+    if reason is not None:
+        auth_failure_tracker.record(client_ip)
+        return None, reason
+    
+    try:
+        api_key_obj = APIKey.objects.get(key_prefix=prefix, is_active=True)
+    except APIKey.DoesNotExist:
+        api_key_cache.mark_invalid(key_hash, RESOLVE_NOT_FOUND, prefix=prefix)
+        auth_failure_tracker.record(client_ip)
+        return None, RESOLVE_NOT_FOUND
+    
+    # Verify the complete key
+    if not api_key_obj.verify_key(api_key):
+        api_key_cache.mark_invalid(key_hash, RESOLVE_INVALID)
+        auth_failure_tracker.record(client_ip)
+        return None, RESOLVE_INVALID
+    
+    api_key_cache.set(api_key_obj)
+    return api_key_obj, None
 
 
 class APIKeyAuthentication(BaseAuthentication):
@@ -27,34 +78,31 @@ class APIKeyAuthentication(BaseAuthentication):
         if auth_type.lower() != 'apikey':
             return None
         
-        return self.authenticate_credentials(api_key)
+        with timed('auth'):
+            return self.authenticate_credentials(api_key, request)
     
-    def authenticate_credentials(self, api_key):
+    def authenticate_credentials(self, api_key, request=None):
         """
         Authenticate the given API key.
         """
         if len(api_key) < 8:
             raise AuthenticationFailed('Invalid API key format.')
         
-        # Get the prefix to find the API key record
-        prefix = api_key[:8]
+        client_ip = get_client_ip(request) if request is not None else None
+        api_key_obj, error = resolve_api_key(api_key, client_ip)
         
-        try:
-            api_key_obj = APIKey.objects.get(key_prefix=prefix, is_active=True)
-        except APIKey.DoesNotExist:
+        if error == RESOLVE_BLOCKED:
+            raise Throttled(detail='Too many failed authentication attempts.')
+        if api_key_obj is None:
             raise AuthenticationFailed('Invalid API key.')
         
         # Check if the key has expired
         if api_key_obj.expires_at and api_key_obj.expires_at < timezone.now():
             raise AuthenticationFailed('API key has expired.')
         
-        # Verify the complete key
-        if not api_key_obj.verify_key(api_key):
-            raise AuthenticationFailed('Invalid API key.')
-        
-        # Update last used timestamp
+        # Record last used timestamp; persisted in batches by the buffer
         api_key_obj.last_used = timezone.now()
-        api_key_obj.save(update_fields=['last_used'])
+        last_used_buffer.record(api_key_obj.pk, api_key_obj.last_used)
         
         # Return a tuple of (user, auth) where user can be None for API key auth
         # We'll use the API key object as the auth token
@@ -73,25 +121,18 @@ class RateLimitMixin:
     Mixin to add rate limiting functionality to views.
     """
     
+    def get_rate_limit_result(self, api_key, cost=1):
+        """
+        Charge a request against the API key's hourly budget and return the
+        full decision (remaining quota, reset time, retry delay).
+        """
+        return get_rate_limiter().hit(f"api_key:{api_key.id}", api_key.rate_limit, cost=cost)
+    
     def check_rate_limit(self, api_key):
         """
         Check if the API key has exceeded its rate limit.
-        This is a simple implementation - in production, you might want to use Redis or similar.
         """
-        from django.core.cache import cache
-        
         if not api_key:
             return True
         
-        cache_key = f"rate_limit_{api_key.id}"
-        current_hour = timezone.now().replace(minute=0, second=0, microsecond=0)
-        cache_key_with_hour = f"{cache_key}_{current_hour.timestamp()}"
-        
-        current_count = cache.get(cache_key_with_hour, 0)
-        
-        if current_count >= api_key.rate_limit:
-            return False
-        
-        # Increment the counter
-        cache.set(cache_key_with_hour, current_count + 1, timeout=3600)  # 1 hour timeout
-        return True
\ No newline at end of file
+        return self.get_rate_limit_result(api_key).allowed
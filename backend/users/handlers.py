@@ -0,0 +1,151 @@
+"""
+Request handlers with per-URL-prefix middleware profiles.
+
+MIDDLEWARE_PROFILES maps a path prefix to the middleware its requests skip.
+Each profile's chain is built once, when the handler loads its middleware,
+and every request is dispatched to the longest matching profile or to the
+full settings.MIDDLEWARE chain. API clients authenticate with API keys, so
+/api/ can drop session, CSRF, auth and message middleware while /admin/
+keeps the full stack.
+"""
+
+import logging
+
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('django.request')
+
+
+def get_middleware_profiles():
+    """Return MIDDLEWARE_PROFILES as {prefix: [skipped middleware paths]}"""
+    return getattr(settings, 'MIDDLEWARE_PROFILES', {})
+
+
+class MiddlewareChainHandler(BaseHandler):
+    """
+    BaseHandler whose chain is built from the given middleware list instead
+    of settings.MIDDLEWARE. load_middleware follows BaseHandler's, including
+    sync/async adaptation and MiddlewareNotUsed.
+    """
+
+    def __init__(self, middleware):
+        super().__init__()
+        self.middleware = list(middleware)
+
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        get_response = self._get_response_async if is_async else self._get_response
+        handler = convert_exception_to_response(get_response)
+        handler_is_async = is_async
+        for middleware_path in reversed(self.middleware):
+            middleware = import_string(middleware_path)
+            middleware_can_sync = getattr(middleware, 'sync_capable', True)
+            middleware_can_async = getattr(middleware, 'async_capable', False)
+            if not middleware_can_sync and not middleware_can_async:
+                raise RuntimeError(
+                    f"Middleware {middleware_path} must have at least one of "
+                    "sync_capable/async_capable set to True."
+                )
+            elif not handler_is_async and middleware_can_sync:
+                middleware_is_async = False
+            else:
+                middleware_is_async = middleware_can_async
+            try:
+                adapted_handler = self.adapt_method_mode(
+                    middleware_is_async, handler, handler_is_async,
+                    debug=settings.DEBUG, name=f"middleware {middleware_path}",
+                )
+                mw_instance = middleware(adapted_handler)
+            except MiddlewareNotUsed as exc:
+                if settings.DEBUG:
+                    logger.debug("MiddlewareNotUsed(%r): %s", middleware_path, exc)
+                continue
+            handler = adapted_handler
+
+            if mw_instance is None:
+                raise ImproperlyConfigured(f"Middleware factory {middleware_path} returned None.")
+
+            if hasattr(mw_instance, 'process_view'):
+                self._view_middleware.insert(0, self.adapt_method_mode(is_async, mw_instance.process_view))
+            if hasattr(mw_instance, 'process_template_response'):
+                self._template_response_middleware.append(
+                    self.adapt_method_mode(is_async, mw_instance.process_template_response)
+                )
+            if hasattr(mw_instance, 'process_exception'):
+                # Django runs the exception stack synchronously
+                self._exception_middleware.append(
+                    self.adapt_method_mode(False, mw_instance.process_exception)
+                )
+
+            handler = convert_exception_to_response(mw_instance)
+            handler_is_async = middleware_is_async
+
+        self._middleware_chain = self.adapt_method_mode(is_async, handler, handler_is_async)
+
+
+def build_middleware_handler(middleware, is_async=False):
+    """Return a handler whose chain is built from the given middleware list"""
+    handler = MiddlewareChainHandler(middleware)
+    handler.load_middleware(is_async=is_async)
+    return handler
+
+
+class ProfileHandlerMixin:
+    """Dispatch requests to a middleware chain chosen by path prefix"""
+
+    def load_middleware(self, is_async=False):
+        super().load_middleware(is_async=is_async)
+
+        self.profile_handlers = []
+        for prefix, skipped in get_middleware_profiles().items():
+            middleware = [path for path in settings.MIDDLEWARE if path not in skipped]
+            self.profile_handlers.append((prefix, build_middleware_handler(middleware, is_async)))
+        self.profile_handlers.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def handler_for(self, request):
+        for prefix, handler in self.profile_handlers:
+            if request.path_info.startswith(prefix):
+                return handler
+        return None
+
+    def get_response(self, request):
+        handler = self.handler_for(request)
+        if handler is None:
+            return super().get_response(request)
+        return handler.get_response(request)
+
+    async def get_response_async(self, request):
+        handler = self.handler_for(request)
+        if handler is None:
+            return await super().get_response_async(request)
+        return await handler.get_response_async(request)
+
+
+class ProfileWSGIHandler(ProfileHandlerMixin, WSGIHandler):
+    pass
+
+
+class ProfileASGIHandler(ProfileHandlerMixin, ASGIHandler):
+    pass
+
+
+def get_wsgi_application():
+    """Like django.core.wsgi.get_wsgi_application, with middleware profiles"""
+    django.setup(set_prefix=False)
+    return ProfileWSGIHandler()
+
+
+def get_asgi_application():
+    """Like django.core.asgi.get_asgi_application, with middleware profiles"""
+    django.setup(set_prefix=False)
+    return ProfileASGIHandler()
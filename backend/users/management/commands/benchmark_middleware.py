@@ -0,0 +1,54 @@
+import logging
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from users.handlers import build_middleware_handler, get_middleware_profiles
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request overhead of the full and profiled middleware chains'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='/api/users/api-key/validate/',
+            help='Request path (default: /api/users/api-key/validate/)'
+        )
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=2000,
+            help='Requests per timing run (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        number = options['number']
+
+        skipped = next(
+            (skip for prefix, skip in get_middleware_profiles().items() if path.startswith(prefix)),
+            []
+        )
+        chains = [
+            ('full stack', list(settings.MIDDLEWARE)),
+            ('profile', [m for m in settings.MIDDLEWARE if m not in skipped]),
+        ]
+
+        factory = RequestFactory()
+        # Rejections would otherwise be logged on every request
+        logging.disable(logging.WARNING)
+        self.stdout.write(self.style.SUCCESS(f'GET {path}'))
+        self.stdout.write('-' * 80)
+
+        for name, middleware in chains:
+            handler = build_middleware_handler(middleware)
+
+            def request():
+                response = handler.get_response(factory.get(path, REMOTE_ADDR='192.0.2.1'))
+                response.close()
+
+            request()  # Warm up
+            best = min(timeit.repeat(request, number=number, repeat=3))
+            self.stdout.write(f'{name:<14} {len(middleware):2} middleware {best / number * 1e6:10.1f} us/request')
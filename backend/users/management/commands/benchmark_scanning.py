@@ -0,0 +1,109 @@
+import json
+import random
+import string
+import timeit
+
+from django.core.management.base import BaseCommand
+from users.scanning import SUSPICIOUS_RULES, screen_content, suspicious_content_scanner
+
+
+def legacy_scan(text):
+    """The original one-regex-at-a-time loop, kept as the baseline"""
+    for rule in SUSPICIOUS_RULES:
+        if rule.pattern.search(text):
+            return rule.name
+    return None
+
+
+def legacy_screen(text):
+    """The original per-character control-character and length check"""
+    for char in text:
+        if ord(char) < 32 and char not in ['\t', '\n', '\r']:
+            return 'control_characters'
+    if len(text) > 10000:
+        return 'too_long'
+    return None
+
+
+def adversarial_inputs(size):
+    """
+    Crafted inputs that make the original regexes backtrack, keyed by the
+    rule they target. Each is roughly ``size`` characters long.
+    """
+    return {
+        'sql_union_select': 'union select ' * (size // 13),
+        'sql_delete_from': 'delete from where ' * (size // 18) + "'",
+        'sql_insert_into': 'insert into values ' + '(' * (size // 2) + "'" * (size // 2 - 20),
+        'sql_comment': '";' * (size // 2) + '\n--',
+        'xss_script_tag': '<script>' * (size // 8) + '</script',
+        'xss_iframe': '<iframe ' * (size // 8),
+        'xss_object': '<object ' * (size // 8),
+        'cmd_substitution': '$(rm' * (size // 4),
+        'template_injection': '{{ eval ' * (size // 8),
+    }
+
+
+def make_body(size, seed=1):
+    """Build a realistic JSON body of roughly ``size`` bytes"""
+    rng = random.Random(seed)
+    words = [
+        ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+        for _ in range(500)
+    ]
+    address = ' '.join(rng.choice(words) for _ in range(size // 4))
+    return json.dumps({'name': 'John Doe', 'address': address})[:size]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark suspicious-content scanning on request-sized bodies'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=10 * 1024,
+            help='Body size in bytes (default: 10240)'
+        )
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=200,
+            help='Scans per timing run (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        body = make_body(options['size'])
+        number = options['number']
+
+        self.stdout.write(self.style.SUCCESS(f'Scanning a {len(body)} byte body'))
+        self.stdout.write('-' * 80)
+
+        self._compare(
+            'Pattern scan',
+            [('legacy loop', lambda: legacy_scan(body)),
+             ('scanner', lambda: suspicious_content_scanner.scan(body))],
+            number
+        )
+
+        raw = body.encode('utf-8')
+        self._compare(
+            'Control-character screen',
+            [('legacy loop', lambda: legacy_screen(raw.decode('utf-8'))),
+             ('screen', lambda: screen_content(raw))],
+            number
+        )
+
+        self.stdout.write('Adversarial inputs (scanner only; the legacy loop can take seconds)')
+        for rule, text in adversarial_inputs(options['size']).items():
+            best = min(timeit.repeat(lambda: suspicious_content_scanner.scan(text), number=1, repeat=3))
+            self.stdout.write(f'  {rule:<20} {best * 1e3 / (len(text) / 1024):8.2f} ms/KB')
+
+    def _compare(self, title, candidates, number):
+        self.stdout.write(title)
+        timings = []
+        for name, func in candidates:
+            best = min(timeit.repeat(func, number=number, repeat=5))
+            timings.append(best / number * 1e6)
+            self.stdout.write(f'  {name:<12} {timings[-1]:10.1f} us/scan')
+
+        self.stdout.write(f'  Speedup: {timings[0] / timings[-1]:.1f}x')
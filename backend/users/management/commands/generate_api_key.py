@@ -24,10 +24,17 @@ class Command(BaseCommand):
             default=1000,
             help='Rate limit per hour (default: 1000)'
         )
+        parser.add_argument(
+            '--max-concurrent',
+            type=int,
+            default=10,
+            help='Maximum in-flight requests, 0 for unlimited (default: 10)'
+        )
 
     def handle(self, *args, **options):
         name = options['name']
         rate_limit = options['rate_limit']
+        max_concurrent = options['max_concurrent']
         
         # Parse permissions
         permissions = {}
@@ -44,7 +51,8 @@ class Command(BaseCommand):
             api_key_obj, key = APIKey.generate_key(
                 name=name,
                 permissions=permissions,
-                rate_limit=rate_limit
+                rate_limit=rate_limit,
+                max_concurrent=max_concurrent
             )
             
             self.stdout.write(
@@ -54,6 +62,7 @@ class Command(BaseCommand):
             self.stdout.write(f'Prefix: {api_key_obj.key_prefix}')
             self.stdout.write(f'Permissions: {permissions}')
             self.stdout.write(f'Rate Limit: {rate_limit} requests/hour')
+            self.stdout.write(f'Max Concurrent: {max_concurrent or "unlimited"}')
             self.stdout.write(
                 self.style.WARNING('Save this key securely - it will not be shown again!')
             )
@@ -31,6 +31,7 @@ class Command(BaseCommand):
             self.stdout.write(f'   Created: {api_key.created_at.strftime("%Y-%m-%d %H:%M")}')
             self.stdout.write(f'   Last Used: {last_used}')
             self.stdout.write(f'   Rate Limit: {api_key.rate_limit}/hour')
+            self.stdout.write(f'   Max Concurrent: {api_key.max_concurrent or "unlimited"}')
             self.stdout.write(f'   Permissions: {api_key.permissions}')
             
             if api_key.expires_at:
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from users.models import APIKey
+from users.api_key_cache import api_key_cache
 
 
 class Command(BaseCommand):
@@ -28,6 +29,9 @@ class Command(BaseCommand):
             api_key.is_active = False
             api_key.save()
             
+            # Drop cached credentials so the key stops authenticating
+            api_key_cache.invalidate(api_key.key_hash)
+            
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully revoked API key: {api_key.key_name}')
             )
@@ -0,0 +1,144 @@
+"""
+Prometheus metrics.
+
+MetricsMiddleware counts requests and their latency per view, method and
+status, plus DB queries and time (from the request's users.timing timer) and
+rate limit rejections. RequestValidationMiddleware counts its blocks by rule
+and the API key cache counts hits and misses per level.
+
+Each gunicorn worker keeps its own values. With PROMETHEUS_MULTIPROC_DIR set
+(docker-entrypoint.sh does), prometheus_client stores them in memory-mapped
+files in that directory and the /metrics view merges every worker's files
+on each scrape; gunicorn.conf.py cleans up after workers that exit. Without
+it, /metrics reports the serving process only.
+
+Latency and DB timings reveal backend internals, so /metrics answers only
+scrapes presenting ``Authorization: Bearer <METRICS_SETTINGS['SCRAPE_TOKEN']>``
+and refuses every request while no token is configured.
+"""
+
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+from .timing import current_timer, normalize_method
+
+REQUESTS = Counter(
+    'django_http_requests_total', 'Requests by view, method and status', ['view', 'method', 'status']
+)
+LATENCY = Histogram(
+    'django_http_request_duration_seconds', 'Request latency by view and method', ['view', 'method']
+)
+DB_QUERIES = Counter(
+    'django_db_queries_total', 'Database queries by view', ['view']
+)
+DB_DURATION = Histogram(
+    'django_db_request_duration_seconds', 'Database time per request by view', ['view']
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    'rate_limit_rejections_total', 'Requests rejected by the rate limiter by view', ['view']
+)
+VALIDATION_BLOCKS = Counter(
+    'request_validation_blocks_total', 'Requests blocked by RequestValidationMiddleware by rule', ['rule']
+)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Cache lookups by cache and result', ['cache', 'result']
+)
+
+# Label for requests rejected before URL resolution (or that matched nothing),
+# so arbitrary paths cannot blow up label cardinality; methods are bucketed
+# the same way by normalize_method
+UNRESOLVED_VIEW = 'unresolved'
+
+
+def get_metrics_setting(name, default):
+    """Read a value from the METRICS_SETTINGS dict with a fallback"""
+    return getattr(settings, 'METRICS_SETTINGS', {}).get(name, default)
+
+
+def is_authorized_scrape(request):
+    """True if the request carries the configured scrape token"""
+    token = get_metrics_setting('SCRAPE_TOKEN', '')
+    if not token:
+        return False
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def record_block(rule):
+    VALIDATION_BLOCKS.labels(rule).inc()
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def observe_request(request, response, seconds):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match is not None else UNRESOLVED_VIEW
+
+    method = normalize_method(request.method)
+    REQUESTS.labels(view, method, str(response.status_code)).inc()
+    LATENCY.labels(view, method).observe(seconds)
+
+    timer = current_timer()
+    if timer is not None and timer.queries:
+        DB_QUERIES.labels(view).inc(timer.queries)
+        DB_DURATION.labels(view).observe(timer.stages.get('db', 0.0))
+
+    result = getattr(request, 'rate_limit_result', None)
+    if result is not None and not result.allowed:
+        RATE_LIMIT_REJECTIONS.labels(view).inc()
+
+
+class MetricsMiddleware:
+    """
+    Middleware recording request metrics. It sits inside
+    ServerTimingMiddleware so the request's timer is still current.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        observe_request(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        observe_request(request, response, time.perf_counter() - started)
+        return response
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint, aggregated across workers when possible"""
+    if not is_authorized_scrape(request):
+        return HttpResponseForbidden()
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -1,10 +1,18 @@
-import json
 import logging
+import math
+from asgiref.sync import iscoroutinefunction
 from django.http import JsonResponse
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from django.core.exceptions import SuspiciousOperation
-import re
+from .metrics import record_block
+from .offenders import get_client_ip, offender_tracker
+from .parsers import (
+    NDJSON_MEDIA_TYPE, JSONTooDeep, attach_parsed_json, get_max_data_size, loads_json, loads_ndjson,
+)
+from .validators import JSONLimits, check_json_structure
+from .scanning import MAX_VALUE_LENGTH, SUSPICIOUS_RULES, screen_content, suspicious_content_scanner
+from .timing import timed
 
 logger = logging.getLogger(__name__)
 
@@ -14,45 +22,87 @@ class RequestValidationMiddleware(MiddlewareMixin):
     Middleware for comprehensive request validation and security
     """
     
-    # Suspicious patterns to detect potential attacks (refined for fewer false positives)
-    SUSPICIOUS_PATTERNS = [
-        # SQL Injection patterns (more specific)
-        re.compile(r'\bunion\s+select\b.*\bfrom\b', re.IGNORECASE),
-        re.compile(r'\bdrop\s+table\b', re.IGNORECASE),
-        re.compile(r'\bdelete\s+from\b.*\bwhere\b.*[\'"].*[\'"]', re.IGNORECASE),
-        re.compile(r'\binsert\s+into\b.*\bvalues\b.*\([^)]*[\'"][^\'")]*[\'"][^)]*\)', re.IGNORECASE),
-        re.compile(r'[\'"];.*--', re.IGNORECASE),  # SQL injection with comments
-        
-        # XSS patterns (more specific)
-        re.compile(r'<script[^>]*>.*?</script>', re.IGNORECASE | re.DOTALL),
-        re.compile(r'javascript\s*:\s*[^;]+', re.IGNORECASE),
-        re.compile(r'<iframe[^>]*src\s*=', re.IGNORECASE),
-        re.compile(r'<object[^>]*data\s*=', re.IGNORECASE),
-        
-        # Path traversal patterns (more specific)
-        re.compile(r'\.\.[\\/]\.\.[\\/]\.\.[\\/]'),  # Multiple directory traversals
-        re.compile(r'[\\/]etc[\\/]passwd'),
-        re.compile(r'[\\/]proc[\\/]self[\\/]'),
-        
-        # Command injection patterns (very specific)
-        re.compile(r'[;&|`]\s*(rm\s+-rf|cat\s+\/etc|wget\s+http)', re.IGNORECASE),
-        re.compile(r'\$\([^)]*rm[^)]*\)', re.IGNORECASE),
-        
-        # Template injection patterns (specific)
-        re.compile(r'\{\{.*(__import__|eval|exec).*\}\}', re.IGNORECASE),
-    ]
+    # Suspicious patterns to detect potential attacks; see users.scanning
+    SUSPICIOUS_PATTERNS = [rule.pattern for rule in SUSPICIOUS_RULES]
+    
+    # Per-node limits plus a global budget for parsed JSON bodies
+    JSON_LIMITS = JSONLimits(
+        max_depth=10,
+        max_keys=100,
+        max_array_length=1000,
+        max_key_length=100,
+        max_string_length=5000,  # 5KB limit for string values
+        max_nodes=10000,
+        max_chars=1024 * 1024,
+    )
     
     # Allowed content types
     ALLOWED_CONTENT_TYPES = [
         'application/json',
+        NDJSON_MEDIA_TYPE,
         'application/x-www-form-urlencoded',
         'multipart/form-data',
         'text/plain',
     ]
     
+    # Bodies screened, parsed and structure-checked here
+    JSON_CONTENT_TYPES = ('application/json', NDJSON_MEDIA_TYPE)
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            # An async handler awaits a coroutine process_view directly instead
+            # of running the sync one in a thread
+            self.process_view = self.aprocess_view
+    
     def process_request(self, request):
         """Process incoming request for validation"""
         
+        with timed('validation'):
+            # Banned repeat offenders are turned away before any other work
+            ban_remaining = offender_tracker.ban_remaining(self._get_client_ip(request))
+            if ban_remaining:
+                return self._banned_response(ban_remaining)
+            
+            rejection = self._validate_request(request)
+            if rejection:
+                return self._reject(request, *rejection)
+        return None
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Process view for additional validation"""
+        with timed('validation'):
+            rejection = self._validate_view(request, view_func)
+            if rejection:
+                return self._reject(request, *rejection)
+        return None
+    
+    async def __acall__(self, request):
+        """
+        Async counterpart of process_request. The checks are CPU-bound, so
+        they run inline on the event loop; only the cache lookups await.
+        """
+        with timed('validation'):
+            ban_remaining = await offender_tracker.aban_remaining(self._get_client_ip(request))
+            if ban_remaining:
+                return self._banned_response(ban_remaining)
+            
+            rejection = self._validate_request(request)
+            if rejection:
+                return await self._areject(request, *rejection)
+        return await self.get_response(request)
+    
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        """Async counterpart of process_view"""
+        with timed('validation'):
+            rejection = self._validate_view(request, view_func)
+            if rejection:
+                return await self._areject(request, *rejection)
+        return None
+    
+    def _validate_request(self, request):
+        """Check the request line and headers; returns (rule, payload, status) to reject it"""
+        
         # Skip validation for certain paths
         skip_paths = ['/admin/', '/static/', '/media/']
         if any(request.path.startswith(path) for path in skip_paths):
@@ -68,10 +118,10 @@ class RequestValidationMiddleware(MiddlewareMixin):
                     
                     if content_length > max_size:
                         logger.warning(f"Request too large: {content_length} bytes from {self._get_client_ip(request)}")
-                        return JsonResponse({
+                        return ('too_large', {
                             'error': 'Request too large',
                             'message': f'Maximum request size is {max_size} bytes'
-                        }, status=413)
+                        }, 413)
                 except ValueError:
                     pass
         
@@ -80,10 +130,10 @@ class RequestValidationMiddleware(MiddlewareMixin):
             content_type = request.content_type.split(';')[0] if request.content_type else ''
             if content_type and content_type not in self.ALLOWED_CONTENT_TYPES:
                 logger.warning(f"Invalid content type: {content_type} from {self._get_client_ip(request)}")
-                return JsonResponse({
+                return ('content_type', {
                     'error': 'Invalid content type',
                     'message': f'Allowed content types: {", ".join(self.ALLOWED_CONTENT_TYPES)}'
-                }, status=400)
+                }, 400)
         
         # Validate headers for suspicious content (skip common headers)
         skip_headers = [
@@ -95,155 +145,185 @@ class RequestValidationMiddleware(MiddlewareMixin):
         
         for header_name, header_value in request.META.items():
             if header_name.startswith('HTTP_') and header_name not in skip_headers:
-                if self._contains_suspicious_content(str(header_value)):
-                    logger.warning(f"Suspicious header content in {header_name} from {self._get_client_ip(request)}")
-                    return JsonResponse({
+                rule = self._match_suspicious_content(str(header_value))
+                if rule:
+                    logger.warning(f"Suspicious header content in {header_name} ({rule}) from {self._get_client_ip(request)}")
+                    return (rule, {
                         'error': 'Invalid request',
                         'message': 'Request contains potentially harmful content'
-                    }, status=400)
+                    }, 400)
         
         # Validate query parameters
         for param_name, param_value in request.GET.items():
-            if self._contains_suspicious_content(param_value):
-                logger.warning(f"Suspicious query parameter {param_name} from {self._get_client_ip(request)}")
-                return JsonResponse({
+            rule = self._match_suspicious_content(param_value)
+            if rule:
+                logger.warning(f"Suspicious query parameter {param_name} ({rule}) from {self._get_client_ip(request)}")
+                return (rule, {
                     'error': 'Invalid request',
                     'message': 'Query parameters contain potentially harmful content'
-                }, status=400)
+                }, 400)
         
         # Validate URL path
-        if self._contains_suspicious_content(request.path):
-            logger.warning(f"Suspicious URL path: {request.path} from {self._get_client_ip(request)}")
-            return JsonResponse({
+        rule = self._match_suspicious_content(request.path)
+        if rule:
+            logger.warning(f"Suspicious URL path: {request.path} ({rule}) from {self._get_client_ip(request)}")
+            return (rule, {
                 'error': 'Invalid request',
                 'message': 'URL contains potentially harmful content'
-            }, status=400)
+            }, 400)
         
         return None
     
-    def process_view(self, request, view_func, view_args, view_kwargs):
-        """Process view for additional validation"""
+    def _validate_view(self, request, view_func):
+        """Check the request body; returns (rule, payload, status) to reject it"""
         
         # Skip validation for certain views
         if hasattr(view_func, '__name__') and view_func.__name__ in ['admin', 'static', 'media']:
             return None
         
         # Validate POST/PUT data for JSON requests
-        if request.method in ['POST', 'PUT', 'PATCH'] and request.content_type == 'application/json':
+        if request.method in ['POST', 'PUT', 'PATCH'] and request.content_type in self.JSON_CONTENT_TYPES:
             try:
                 if hasattr(request, 'body') and request.body:
-                    # Check if body contains suspicious content
-                    body_str = request.body.decode('utf-8')
+                    # A JSON body is all data, so hold it to the parsers' limit before scanning it
+                    max_size = get_max_data_size()
+                    if len(request.body) > max_size:
+                        logger.warning(f"Request data too large: {len(request.body)} bytes from {self._get_client_ip(request)}")
+                        return ('too_large', {
+                            'error': 'Request too large',
+                            'message': f'Maximum request data size is {max_size} bytes'
+                        }, 413)
+                    
+                    # Screen the raw bytes before paying for a decode
+                    rule = screen_content(request.body, max_length=self._get_max_body_length(view_func, max_size))
+                    if not rule:
+                        # Check if body contains suspicious content
+                        body_str = request.body.decode('utf-8')
+                        rule = suspicious_content_scanner.scan(body_str)
                     
-                    if self._contains_suspicious_content(body_str):
-                        logger.warning(f"Suspicious request body from {self._get_client_ip(request)}")
-                        return JsonResponse({
+                    if rule:
+                        logger.warning(f"Suspicious request body ({rule}) from {self._get_client_ip(request)}")
+                        return (rule, {
                             'error': 'Invalid request',
                             'message': 'Request body contains potentially harmful content'
-                        }, status=400)
+                        }, 400)
                     
                     # Validate JSON structure
                     try:
-                        json_data = json.loads(body_str)
-                        if not self._validate_json_structure(json_data):
+                        if request.content_type == NDJSON_MEDIA_TYPE:
+                            json_data = loads_ndjson(body_str)
+                        else:
+                            json_data = loads_json(body_str)
+                        
+                        # Without escapes every key and string appears verbatim,
+                        # between quotes, in the body already scanned above
+                        scan_strings = b'\\' in request.body
+                        if not self._validate_json_structure(json_data, scan_strings):
                             logger.warning(f"Invalid JSON structure from {self._get_client_ip(request)}")
-                            return JsonResponse({
+                            return ('json_structure', {
                                 'error': 'Invalid request',
                                 'message': 'JSON structure is invalid or too complex'
-                            }, status=400)
-                    except json.JSONDecodeError:
+                            }, 400)
+                        
+                        # Let the DRF parser reuse this instead of parsing again
+                        attach_parsed_json(request, json_data)
+                    except JSONTooDeep:
+                        # Too deep to even parse, so far past JSON_LIMITS.max_depth
+                        logger.warning(f"Invalid JSON structure from {self._get_client_ip(request)}")
+                        return ('json_structure', {
+                            'error': 'Invalid request',
+                            'message': 'JSON structure is invalid or too complex'
+                        }, 400)
+                    except ValueError:
                         logger.warning(f"Invalid JSON from {self._get_client_ip(request)}")
-                        return JsonResponse({
+                        return ('invalid_json', {
                             'error': 'Invalid JSON',
                             'message': 'Request body contains invalid JSON'
-                        }, status=400)
+                        }, 400)
             
             except UnicodeDecodeError:
                 logger.warning(f"Invalid encoding in request body from {self._get_client_ip(request)}")
-                return JsonResponse({
+                return ('invalid_encoding', {
                     'error': 'Invalid encoding',
                     'message': 'Request body contains invalid character encoding'
-                }, status=400)
+                }, 400)
         
         return None
     
+    def _get_max_body_length(self, view_func, max_size):
+        """
+        Longest JSON body the view accepts, in characters. Views taking large
+        bodies set ``max_body_length``; None allows up to max_size, since
+        JSON_LIMITS still bounds each value in the body.
+        """
+        view_class = getattr(view_func, 'view_class', None)
+        max_length = getattr(view_class, 'max_body_length', MAX_VALUE_LENGTH)
+        return max_size if max_length is None else min(max_length, max_size)
+    
     def _contains_suspicious_content(self, content):
         """Check if content contains suspicious patterns"""
+        return self._match_suspicious_content(content) is not None
+    
+    def _match_suspicious_content(self, content):
+        """Return the name of the rule the content violates, or None"""
         if not content:
-            return False
+            return None
         
         content_str = str(content)
         
-        # Check against suspicious patterns
-        for pattern in self.SUSPICIOUS_PATTERNS:
-            if pattern.search(content_str):
-                return True
-        
-        # Check for control characters (except common ones)
-        for char in content_str:
-            if ord(char) < 32 and char not in ['\t', '\n', '\r']:
-                return True
+        # Check for control characters and excessive length in bulk
+        rule = screen_content(content_str)
+        if rule:
+            return rule
         
-        # Check for excessive length
-        if len(content_str) > 10000:  # 10KB limit for individual values
-            return True
-        
-        return False
+        # Check against suspicious patterns in a single prefiltered pass
+        return suspicious_content_scanner.scan(content_str)
     
-    def _validate_json_structure(self, data, depth=0, key_count=0):
+    def _validate_json_structure(self, data, scan_strings=True):
         """Validate JSON structure for security"""
-        max_depth = 10
-        max_keys = 100
-        max_array_length = 1000
-        
-        if depth > max_depth:
+        scan = self._match_suspicious_content if scan_strings else None
+        try:
+            check_json_structure(data, self.JSON_LIMITS, scan=scan)
+        except ValueError:
             return False
-        
-        if isinstance(data, dict):
-            if len(data) > max_keys:
-                return False
-            
-            for key, value in data.items():
-                if not isinstance(key, str) or len(key) > 100:
-                    return False
-                
-                if self._contains_suspicious_content(key):
-                    return False
-                
-                if not self._validate_json_structure(value, depth + 1, key_count + len(data)):
-                    return False
-        
-        elif isinstance(data, list):
-            if len(data) > max_array_length:
-                return False
-            
-            for item in data:
-                if not self._validate_json_structure(item, depth + 1, key_count):
-                    return False
-        
-        elif isinstance(data, str):
-            if len(data) > 5000:  # 5KB limit for string values
-                return False
-            
-            if self._contains_suspicious_content(data):
-                return False
-        
         return True
     
+    def _reject(self, request, rule, payload, status):
+        """Reject the request and count a strike against the client IP"""
+        record_block(rule)
+        client_ip = self._get_client_ip(request)
+        ban_seconds = offender_tracker.record(client_ip)
+        if ban_seconds:
+            logger.warning(f"Banned {client_ip} for {ban_seconds} seconds after repeated invalid requests")
+        return JsonResponse(payload, status=status)
+    
+    async def _areject(self, request, rule, payload, status):
+        """Async counterpart of _reject"""
+        record_block(rule)
+        client_ip = self._get_client_ip(request)
+        ban_seconds = await offender_tracker.arecord(client_ip)
+        if ban_seconds:
+            logger.warning(f"Banned {client_ip} for {ban_seconds} seconds after repeated invalid requests")
+        return JsonResponse(payload, status=status)
+    
+    def _banned_response(self, ban_remaining):
+        record_block('banned')
+        response = JsonResponse({
+            'error': 'Forbidden',
+            'message': 'Too many invalid requests. Try again later.'
+        }, status=403)
+        response['Retry-After'] = str(math.ceil(ban_remaining))
+        return response
+    
     def _get_client_ip(self, request):
-        """Get client IP address from request"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        """Get client IP address from request; see offenders.get_client_ip"""
+        return get_client_ip(request)
     
     def process_exception(self, request, exception):
         """Handle exceptions during request processing"""
         if isinstance(exception, SuspiciousOperation):
             logger.warning(f"Suspicious operation from {self._get_client_ip(request)}: {exception}")
-            return JsonResponse({
+            return self._reject(request, 'suspicious_operation', {
                 'error': 'Suspicious operation detected',
                 'message': 'Request blocked for security reasons'
             }, status=400)
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_apikey_permissions_alter_user_address_and_more'),
+    ]
+
+    operations = [
+        # Keys issued before the limit existed stay unlimited; new keys get 10
+        migrations.AddField(
+            model_name='apikey',
+            name='max_concurrent',
+            field=models.PositiveIntegerField(default=0, help_text='Maximum in-flight requests (0 = unlimited)'),
+        ),
+        migrations.AlterField(
+            model_name='apikey',
+            name='max_concurrent',
+            field=models.PositiveIntegerField(default=10, help_text='Maximum in-flight requests (0 = unlimited)'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:25
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def check_case_insensitive_duplicates(apps, schema_editor):
+    """
+    The old unique index was case-sensitive, so rows written outside the
+    serializer (admin, shell) may differ only in case. Stop with a list of
+    them rather than let the new index fail with a bare IntegrityError;
+    which of two accounts to keep is not something a migration can decide.
+    """
+    from django.db.models import Count
+    from django.db.models.functions import Lower
+
+    User = apps.get_model('users', 'User')
+    duplicates = list(
+        User.objects.annotate(email_lower=Lower('email'))
+        .values('email_lower')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Cannot add a case-insensitive unique index on users_user.email: "
+            "these emails are used by more than one user when case is ignored: "
+            f"{', '.join(duplicates)}. Merge or rename those users, then migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_apikey_max_concurrent'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_case_insensitive_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='users_user_email_ci_unique', violation_error_message='A user with this email already exists.'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(help_text='Valid email address', max_length=254),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.core.validators import EmailValidator, RegexValidator
 import os
 import uuid
@@ -12,6 +13,12 @@ def validate_name(value):
     validator = NameValidator()
     validator(value)
 
+# Case-insensitive email uniqueness is enforced by this index rather than by
+# lookups before each write, which would race with concurrent inserts
+USER_EMAIL_UNIQUE_CONSTRAINT = 'users_user_email_ci_unique'
+DUPLICATE_EMAIL_MESSAGE = 'A user with this email already exists.'
+
+
 def validate_email(value):
     from .validators import CustomEmailValidator
     validator = CustomEmailValidator()
@@ -43,6 +50,38 @@ def validate_json_permissions(value):
     validator(value)
 
 
+# Permission bits compiled from the APIKey.permissions JSON
+PERMISSION_READ = 1
+PERMISSION_WRITE = 2
+PERMISSION_DELETE = 4
+PERMISSION_ADMIN = 8
+PERMISSION_ALL = PERMISSION_READ | PERMISSION_WRITE | PERMISSION_DELETE | PERMISSION_ADMIN
+
+PERMISSION_BITS = {
+    'read': PERMISSION_READ,
+    'write': PERMISSION_WRITE,
+    'delete': PERMISSION_DELETE,
+    'admin': PERMISSION_ADMIN,
+}
+
+
+def compile_permissions(permissions):
+    """
+    Turn {'resource': ['read', ...]} into {'resource': bitmask}. Actions
+    without a bit are left out; APIKey.has_permission checks them against
+    the permissions JSON instead.
+    """
+    masks = {}
+    for resource, actions in (permissions or {}).items():
+        mask = 0
+        for action in actions or ():
+            mask |= PERMISSION_BITS.get(action, 0)
+        if mask & PERMISSION_ADMIN:
+            mask = PERMISSION_ALL
+        masks[resource] = mask
+    return masks
+
+
 def user_profile_picture_path(instance, filename):
     """Generate file path for user profile pictures"""
     # Use UUID if instance doesn't have an ID yet (during creation)
@@ -74,6 +113,10 @@ class APIKey(models.Model):
         default=1000,
         help_text="Requests per hour limit"
     )
+    max_concurrent = models.PositiveIntegerField(
+        default=10,
+        help_text="Maximum in-flight requests (0 = unlimited)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     last_used = models.DateTimeField(null=True, blank=True)
     expires_at = models.DateTimeField(null=True, blank=True)
@@ -87,7 +130,7 @@ class APIKey(models.Model):
         return f"{self.key_name} ({self.key_prefix}...)"
 
     @classmethod
-    def generate_key(cls, name, permissions=None, rate_limit=1000):
+    def generate_key(cls, name, permissions=None, rate_limit=1000, max_concurrent=10):
         """Generate a new API key"""
         if permissions is None:
             permissions = {'users': ['read', 'write']}
@@ -97,31 +140,57 @@ class APIKey(models.Model):
         prefix = key[:8]
         
         # Hash the complete key for storage
-        key_hash = hashlib.sha256(key.encode()).hexdigest()
+        key_hash = cls.hash_key(key)
         
         api_key = cls.objects.create(
             key_name=name,
             key_prefix=prefix,
             key_hash=key_hash,
             permissions=permissions,
-            rate_limit=rate_limit
+            rate_limit=rate_limit,
+            max_concurrent=max_concurrent
         )
         
         # Return the complete key (only time it's available in plain text)
         return api_key, key
 
+    @staticmethod
+    def hash_key(key):
+        """Return the SHA-256 hex digest used to store and look up keys"""
+        return hashlib.sha256(key.encode()).hexdigest()
+
     def verify_key(self, provided_key):
         """Verify if the provided key matches this API key"""
-        provided_hash = hashlib.sha256(provided_key.encode()).hexdigest()
-        return self.key_hash == provided_hash
+        return self.key_hash == self.hash_key(provided_key)
+
+    @property
+    def permission_masks(self):
+        """Per-resource permission bitmasks, compiled once per permissions value"""
+        compiled = getattr(self, '_compiled_permissions', None)
+        if compiled is None or compiled[0] is not self.permissions:
+            compiled = (self.permissions, compile_permissions(self.permissions))
+            self._compiled_permissions = compiled
+        return compiled[1]
+
+    def has_permission_bit(self, resource, bit):
+        """Check a compiled permission bit (see PERMISSION_BITS)"""
+        return self.is_active and bool(self.permission_masks.get(resource, 0) & bit)
 
     def has_permission(self, resource, action):
         """Check if this API key has permission for a specific action on a resource"""
-        if not self.is_active:
-            return False
+        bit = PERMISSION_BITS.get(action)
+        if bit is not None:
+            return self.has_permission_bit(resource, bit)
         
-        resource_perms = self.permissions.get(resource, [])
-        return action in resource_perms or 'admin' in resource_perms
+        # Custom actions have no bit; admin still grants everything
+        if self.has_permission_bit(resource, PERMISSION_ADMIN):
+            return True
+        return self.is_active and action in (self.permissions or {}).get(resource, [])
+
+    def save(self, *args, **kwargs):
+        # Permissions may have been mutated in place; recompile on next check
+        self._compiled_permissions = None
+        super().save(*args, **kwargs)
 
     def clean(self):
         """Custom validation for API key"""
@@ -137,7 +206,6 @@ class User(models.Model):
         help_text="User's full name (letters, spaces, hyphens, apostrophes only)"
     )
     email = models.EmailField(
-        unique=True,
         max_length=254,
         help_text="Valid email address"
     )
@@ -171,6 +239,13 @@ class User(models.Model):
         ordering = ['-created_at']
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        constraints = [
+            models.UniqueConstraint(
+                Lower('email'),
+                name=USER_EMAIL_UNIQUE_CONSTRAINT,
+                violation_error_message=DUPLICATE_EMAIL_MESSAGE,
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.email})"
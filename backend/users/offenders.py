@@ -0,0 +1,121 @@
+"""
+Repeat-offender tracking for RequestValidationMiddleware
+"""
+
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_offender_setting(name, default):
+    """Read a value from the OFFENDER_SETTINGS dict with a fallback"""
+    return getattr(settings, 'OFFENDER_SETTINGS', {}).get(name, default)
+
+
+def get_client_ip(request):
+    """
+    The address strikes and bans are keyed on.
+
+    X-Forwarded-For is never used: nginx appends to whatever the client
+    sent, so its first entry is client-controlled. CLIENT_IP_HEADER names a
+    header the trusted proxy overwrites (nginx sets X-Real-IP to the
+    connecting address); without one the peer address is used.
+    """
+    header = get_offender_setting('CLIENT_IP_HEADER', None)
+    if header:
+        ip = request.META.get(header, '').strip()
+        if ip:
+            return ip
+    return request.META.get('REMOTE_ADDR')
+
+
+class OffenderTracker:
+    """
+    Counts rejected requests per client IP in the shared cache.
+
+    STRIKE_THRESHOLD strikes within STRIKE_WINDOW seconds ban the IP. Each
+    ban doubles the previous one, starting at BAN_BASE_SECONDS and capped at
+    BAN_MAX_SECONDS; the ban level is remembered for BAN_MEMORY seconds. A
+    ban is a single cache entry holding its expiry time, so checking one
+    costs one cache lookup.
+    """
+
+    STRIKES_PREFIX = 'offender_strikes'
+    LEVEL_PREFIX = 'offender_level'
+    BAN_PREFIX = 'offender_ban'
+
+    def ban_remaining(self, ip):
+        """Seconds left on the IP's ban, or 0 if it is not banned"""
+        if not ip:
+            return 0
+        expires_at = cache.get(f"{self.BAN_PREFIX}:{ip}")
+        if expires_at is None:
+            return 0
+        return max(0, expires_at - time.time())
+
+    async def aban_remaining(self, ip):
+        """Async counterpart of ban_remaining"""
+        if not ip:
+            return 0
+        expires_at = await cache.aget(f"{self.BAN_PREFIX}:{ip}")
+        if expires_at is None:
+            return 0
+        return max(0, expires_at - time.time())
+
+    def record(self, ip):
+        """Add a strike; returns the ban duration if this strike triggered one"""
+        if not ip:
+            return 0
+
+        window = get_offender_setting('STRIKE_WINDOW', 600)
+        key = f"{self.STRIKES_PREFIX}:{ip}"
+        if cache.add(key, 1, timeout=window):
+            strikes = 1
+        else:
+            try:
+                strikes = cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, timeout=window)
+                strikes = 1
+
+        if strikes < get_offender_setting('STRIKE_THRESHOLD', 10):
+            return 0
+
+        cache.delete(key)
+        return self.ban(ip)
+
+    async def arecord(self, ip):
+        """Async counterpart of record; strikes are rare, so one thread hop is fine"""
+        return await sync_to_async(self.record)(ip)
+
+    def ban(self, ip):
+        memory = get_offender_setting('BAN_MEMORY', 7 * 24 * 3600)
+        level_key = f"{self.LEVEL_PREFIX}:{ip}"
+        if cache.add(level_key, 1, timeout=memory):
+            level = 1
+        else:
+            try:
+                level = cache.incr(level_key)
+            except ValueError:
+                cache.set(level_key, 1, timeout=memory)
+                level = 1
+            cache.touch(level_key, memory)
+
+        duration = min(
+            get_offender_setting('BAN_BASE_SECONDS', 60) * 2 ** (level - 1),
+            get_offender_setting('BAN_MAX_SECONDS', 24 * 3600)
+        )
+        cache.set(f"{self.BAN_PREFIX}:{ip}", time.time() + duration, timeout=duration)
+        return duration
+
+    def reset(self, ip):
+        cache.delete_many([
+            f"{self.STRIKES_PREFIX}:{ip}",
+            f"{self.LEVEL_PREFIX}:{ip}",
+            f"{self.BAN_PREFIX}:{ip}",
+        ])
+
+
+offender_tracker = OffenderTracker()
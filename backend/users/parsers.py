@@ -0,0 +1,178 @@
+"""
+Request body parsers.
+
+RequestValidationMiddleware already decodes and parses JSON and NDJSON
+bodies to check their structure. It attaches the result to the request so the DRF parser can
+hand it straight to the view instead of parsing the same bytes again.
+
+Multipart bodies are not screened by the middleware. StreamingMultiPartParser
+streams their files through StreamingValidationUploadHandler and scans only
+the small text fields.
+
+Non-file request data is capped at INPUT_VALIDATION['MAX_DATA_SIZE'] bytes
+while it is parsed: JSON and form bodies are counted as they are read and
+multipart text fields once the parser has split them off the files. An
+oversized request fails with a 413 before any field is validated.
+"""
+
+from django.conf import settings
+from django.http import QueryDict
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import DataAndFiles, FormParser, JSONParser, MultiPartParser
+from rest_framework.utils import json
+
+from .scanning import screen_content, suspicious_content_scanner
+from .upload_handlers import StreamingValidationUploadHandler
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+# Attribute on the Django request holding the middleware's parsed body
+PARSED_JSON_ATTR = 'parsed_json'
+
+_MISSING = object()
+
+# Bytes read from the body stream at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class DataTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request data too large.'
+    default_code = 'data_too_large'
+
+
+class JSONTooDeep(ValueError):
+    """Raised when a JSON document nests deeper than the parser can recurse"""
+
+
+def get_max_data_size():
+    """Largest accepted non-file request data, in bytes"""
+    return getattr(settings, 'INPUT_VALIDATION', {}).get('MAX_DATA_SIZE', 1024 * 1024)
+
+
+def data_too_large(max_size):
+    return DataTooLarge(f'Request data too large. Maximum size is {max_size} bytes.')
+
+
+def read_limited(stream, max_size):
+    """Read a body stream, failing as soon as more than max_size bytes arrive"""
+    chunks = []
+    size = 0
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return b''.join(chunks)
+        size += len(chunk)
+        if size > max_size:
+            raise data_too_large(max_size)
+        chunks.append(chunk)
+
+
+def loads_json(text, strict=JSONParser.strict):
+    """Parse JSON exactly as DRF's JSONParser would"""
+    parse_constant = json.strict_constant if strict else None
+    try:
+        return json.loads(text, parse_constant=parse_constant)
+    except RecursionError:
+        # The decoder recurses once per nested array or object
+        raise JSONTooDeep('JSON nested too deep')
+
+
+def loads_ndjson(text, strict=JSONParser.strict):
+    """Parse newline-delimited JSON into a list, one value per non-blank line"""
+    values = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            values.append(loads_json(line, strict))
+        except JSONTooDeep as exc:
+            raise JSONTooDeep(f'line {number}: {exc}')
+        except ValueError as exc:
+            raise ValueError(f'line {number}: {exc}')
+    return values
+
+
+def attach_parsed_json(request, data):
+    """Record the validated body on a Django request for PreparsedJSONParser"""
+    setattr(request, PARSED_JSON_ATTR, data)
+
+
+class PreparsedJSONParser(JSONParser):
+    """
+    JSONParser that reuses the body already parsed by the validation
+    middleware, falling back to a normal parse when there is none.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        django_request = getattr(request, '_request', request)
+        data = getattr(django_request, PARSED_JSON_ATTR, _MISSING)
+        if data is not _MISSING:
+            # The middleware already enforced the size limit on this body
+            return data
+
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        body = read_limited(stream, get_max_data_size())
+        try:
+            return self.loads(body.decode(encoding))
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+    def loads(self, text):
+        return loads_json(text, strict=self.strict)
+
+
+class PreparsedNDJSONParser(PreparsedJSONParser):
+    """PreparsedJSONParser for newline-delimited JSON, parsed into a list"""
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    def loads(self, text):
+        return loads_ndjson(text, strict=self.strict)
+
+
+class LimitedFormParser(FormParser):
+    """FormParser that stops reading once the body passes the size limit"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return QueryDict(read_limited(stream, get_max_data_size()), encoding=encoding)
+
+
+class StreamingMultiPartParser(MultiPartParser):
+    """
+    MultiPartParser that streams files to disk with size and type checks
+    applied chunk by chunk, then scans the text fields for harmful content.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = [StreamingValidationUploadHandler(request)]
+
+        try:
+            parser = DjangoMultiPartParser(meta, stream, upload_handlers, encoding)
+            data, files = parser.parse()
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
+
+        max_size = get_max_data_size()
+        size = 0
+        for name, values in data.lists():
+            for value in values:
+                size += len(name.encode(encoding)) + len(value.encode(encoding))
+            if size > max_size:
+                raise data_too_large(max_size)
+
+        for name, values in data.lists():
+            for value in values:
+                if screen_content(name) or screen_content(value) or suspicious_content_scanner.scan(value):
+                    raise ParseError('Form data contains potentially harmful content')
+
+        return DataAndFiles(data, files)
@@ -1,6 +1,27 @@
 from rest_framework.permissions import BasePermission
-from rest_framework.exceptions import PermissionDenied
-from .models import APIKey
+from rest_framework.exceptions import Throttled
+from .models import (
+    APIKey, PERMISSION_READ, PERMISSION_WRITE, PERMISSION_DELETE
+)
+from .throttling import evaluate_rate_limits
+
+
+# Built once; the permission checks below run on every request
+METHOD_ACTIONS = {
+    'GET': 'read',
+    'POST': 'write',
+    'PUT': 'write',
+    'PATCH': 'write',
+    'DELETE': 'delete',
+}
+
+METHOD_PERMISSION_BITS = {
+    'GET': PERMISSION_READ,
+    'POST': PERMISSION_WRITE,
+    'PUT': PERMISSION_WRITE,
+    'PATCH': PERMISSION_WRITE,
+    'DELETE': PERMISSION_DELETE,
+}
 
 
 class HasAPIKeyPermission(BasePermission):
@@ -18,25 +39,18 @@ class HasAPIKeyPermission(BasePermission):
         
         api_key = request.auth
         
-        # Determine the resource and action based on the view and method
+        # Determine the resource and permission bit based on the view and method
         resource = getattr(view, 'permission_resource', 'users')
-        action = self.get_action_from_method(request.method)
+        bit = METHOD_PERMISSION_BITS.get(request.method, PERMISSION_READ)
         
         # Check if the API key has the required permission
-        return api_key.has_permission(resource, action)
+        return api_key.has_permission_bit(resource, bit)
     
     def get_action_from_method(self, method):
         """
         Map HTTP methods to action names.
         """
-        method_mapping = {
-            'GET': 'read',
-            'POST': 'write',
-            'PUT': 'write',
-            'PATCH': 'write',
-            'DELETE': 'delete',
-        }
-        return method_mapping.get(method, 'read')
+        return METHOD_ACTIONS.get(method, 'read')
 
 
 class APIKeyRateLimit(BasePermission):
@@ -51,14 +65,15 @@ class APIKeyRateLimit(BasePermission):
         if not hasattr(request, 'auth') or not isinstance(request.auth, APIKey):
             return True  # Let other authentication handle this
         
-        api_key = request.auth
-        
-        # Check rate limit using the mixin method
-        from .authentication import RateLimitMixin
-        rate_limit_checker = RateLimitMixin()
+        # Evaluate all applicable limits in one pass; the DRF throttle
+        # reuses this decision instead of counting the request again
+        result = evaluate_rate_limits(request, view)
         
-        if not rate_limit_checker.check_rate_limit(api_key):
-            raise PermissionDenied("Rate limit exceeded. Please wait before making more requests.")
+        if result is not None and not result.allowed:
+            raise Throttled(
+                wait=result.retry_after,
+                detail="Rate limit exceeded. Please wait before making more requests."
+            )
         
         return True
 
@@ -77,9 +92,9 @@ class ResourcePermission(BasePermission):
         
         # Get the resource name from the view
         resource = getattr(view, 'permission_resource', 'default')
-        action = self.get_action_from_method(request.method)
+        bit = METHOD_PERMISSION_BITS.get(request.method, PERMISSION_READ)
         
-        return request.auth.has_permission(resource, action)
+        return request.auth.has_permission_bit(resource, bit)
     
     def has_object_permission(self, request, view, obj):
         """
@@ -89,19 +104,12 @@ class ResourcePermission(BasePermission):
             return False
         
         resource = getattr(view, 'permission_resource', 'default')
-        action = self.get_action_from_method(request.method)
+        bit = METHOD_PERMISSION_BITS.get(request.method, PERMISSION_READ)
         
-        return request.auth.has_permission(resource, action)
+        return request.auth.has_permission_bit(resource, bit)
     
     def get_action_from_method(self, method):
         """
         Map HTTP methods to action names.
         """
-        method_mapping = {
-            'GET': 'read',
-            'POST': 'write',
-            'PUT': 'write',
-            'PATCH': 'write',
-            'DELETE': 'delete',
-        }
-        return method_mapping.get(method, 'read')
\ No newline at end of file
+        return METHOD_ACTIONS.get(method, 'read')
\ No newline at end of file
@@ -0,0 +1,631 @@
+"""
+Pluggable rate limiting engine with atomic sliding-window and token-bucket
+algorithms.
+
+Every backend answers a hit in one round trip and returns the remaining
+quota and reset time together with the decision. Several rules (per key,
+per IP, per endpoint) can be checked together in the same round trip.
+"""
+
+import atexit
+import logging
+import math
+import secrets
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+RateLimitResult = namedtuple(
+    'RateLimitResult',
+    ['allowed', 'limit', 'remaining', 'reset_after', 'retry_after']
+)
+
+RateLimitRule = namedtuple('RateLimitRule', ['key', 'limit', 'window'])
+
+SLIDING_WINDOW = 'sliding_window'
+TOKEN_BUCKET = 'token_bucket'
+
+
+def get_rate_limit_setting(name, default):
+    """Read a value from the RATE_LIMIT_SETTINGS dict with a fallback"""
+    return getattr(settings, 'RATE_LIMIT_SETTINGS', {}).get(name, default)
+
+
+def window_offset(key, window):
+    """
+    Stable per-key offset so windows of different keys don't all roll over
+    at the same instant (e.g. the top of the hour).
+    """
+    return zlib.crc32(key.encode()) % int(window)
+
+
+def _sliding_window_decision(now, offset, limit, window, cost, current, previous):
+    """
+    Shared sliding-window-counter maths; returns (allowed, remaining,
+    reset_after, retry_after).
+    """
+    elapsed = (now - offset) % window
+    reset_after = window - elapsed
+    used = previous * (reset_after / window) + current
+
+    if used + cost > limit:
+        retry_after = reset_after
+        if previous > 0 and current + cost <= limit:
+            # Enough of the previous window slides out before the reset
+            retry_after = min(reset_after, (used + cost - limit) * window / previous)
+        return False, max(0, int(limit - used)), reset_after, retry_after
+
+    return True, max(0, int(limit - used - cost)), reset_after, 0
+
+
+def _combine(rules, decisions):
+    """
+    Fold per-rule decisions into one result. The binding rule is the one
+    with the least quota left; the request waits for the slowest denial.
+    """
+    binding = min(range(len(rules)), key=lambda i: decisions[i][1])
+    allowed = all(decision[0] for decision in decisions)
+    retry_after = 0 if allowed else max(decision[3] for decision in decisions)
+    return RateLimitResult(
+        allowed, rules[binding].limit, decisions[binding][1],
+        decisions[binding][2], retry_after
+    )
+
+
+class LocalRateLimitBackend:
+    """
+    In-process backend for tests and single-worker development servers.
+
+    Counters live in this process only; every decision is made under one
+    short critical section so concurrent threads never lose increments.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._windows = {}
+        self._buckets = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def sliding_window(self, key, limit, window, cost=1):
+        return self.sliding_window_many([RateLimitRule(key, limit, window)], cost)
+
+    def token_bucket(self, key, limit, window, cost=1):
+        return self.token_bucket_many([RateLimitRule(key, limit, window)], cost)
+
+    def sliding_window_many(self, rules, cost=1):
+        with self._lock:
+            now = self.clock()
+            decisions = []
+            states = []
+            for key, limit, window in rules:
+                offset = window_offset(key, window)
+                index = math.floor((now - offset) / window)
+                state = self._windows.get(key)
+
+                if state is None or state[0] < index - 1:
+                    current, previous = 0, 0
+                elif state[0] == index - 1:
+                    current, previous = 0, state[1]
+                else:
+                    current, previous = state[1], state[2]
+
+                decisions.append(_sliding_window_decision(
+                    now, offset, limit, window, cost, current, previous
+                ))
+                states.append((index, current, previous))
+
+            result = _combine(rules, decisions)
+            if result.allowed:
+                for rule, (index, current, previous) in zip(rules, states):
+                    self._windows[rule.key] = (index, current + cost, previous)
+
+        return result
+
+    def token_bucket_many(self, rules, cost=1):
+        with self._lock:
+            now = self.clock()
+            decisions = []
+            levels = []
+            for key, limit, window in rules:
+                rate = limit / window
+                tokens, updated_at = self._buckets.get(key, (limit, now))
+                tokens = min(limit, tokens + (now - updated_at) * rate)
+
+                if tokens >= cost:
+                    decisions.append((True, int(tokens - cost), (limit - tokens + cost) / rate, 0))
+                else:
+                    decisions.append((False, int(tokens), (limit - tokens) / rate, (cost - tokens) / rate))
+                levels.append(tokens)
+
+            result = _combine(rules, decisions)
+            if result.allowed:
+                for rule, tokens in zip(rules, levels):
+                    self._buckets[rule.key] = (tokens - cost, now)
+
+        return result
+
+    def sliding_window_refund(self, key, limit, window, amount):
+        offset = window_offset(key, window)
+        with self._lock:
+            index = math.floor((self.clock() - offset) / window)
+            state = self._windows.get(key)
+            if state is None or state[0] != index:
+                return 0
+            refund = min(state[1], amount)
+            self._windows[key] = (index, state[1] - refund, state[2])
+        return refund
+
+    def token_bucket_refund(self, key, limit, window, amount):
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is None:
+                return 0
+            tokens, updated_at = state
+            self._buckets[key] = (min(limit, tokens + amount), updated_at)
+        return amount
+
+    def acquire_slot(self, key, limit, ttl, token):
+        with self._lock:
+            now = self.clock()
+            slots = {
+                held: expires_at
+                for held, expires_at in self._slots.get(key, {}).items()
+                if expires_at > now
+            }
+            acquired = len(slots) < limit
+            if acquired:
+                slots[token] = now + ttl
+            self._slots[key] = slots
+        return acquired
+
+    def release_slot(self, key, token):
+        with self._lock:
+            self._slots.get(key, {}).pop(token, None)
+
+    def reset(self):
+        with self._lock:
+            self._windows.clear()
+            self._buckets.clear()
+            self._slots.clear()
+
+
+class RedisRateLimitBackend:
+    """
+    Shared backend for multi-worker deployments.
+
+    Each algorithm is a Lua script executed atomically on the Redis server,
+    using the server clock so all workers agree on window boundaries. A
+    script evaluates any number of rules at once and only charges them if
+    every rule allows the request.
+    """
+
+    KEY_PREFIX = 'rl'
+
+    # KEYS: one base key per rule; ARGV: cost, then (limit, window, offset) per rule
+    SLIDING_WINDOW_SCRIPT = """
+    local cost = tonumber(ARGV[1])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local allowed = 1
+    local binding, binding_remaining, binding_reset = 1, nil, 0
+    local retry_after = 0
+    local current_keys = {}
+    local windows = {}
+    for i = 1, #KEYS do
+        local limit = tonumber(ARGV[3 * i - 1])
+        local window = tonumber(ARGV[3 * i])
+        local offset = tonumber(ARGV[3 * i + 1])
+        local index = math.floor((now - offset) / window)
+        local current_key = KEYS[i] .. ':' .. index
+        local current = tonumber(redis.call('GET', current_key) or '0')
+        local previous = tonumber(redis.call('GET', KEYS[i] .. ':' .. (index - 1)) or '0')
+        local reset_after = window - ((now - offset) % window)
+        local used = previous * (reset_after / window) + current
+        local remaining
+        if used + cost > limit then
+            allowed = 0
+            local wait = reset_after
+            if previous > 0 and current + cost <= limit then
+                wait = math.min(reset_after, (used + cost - limit) * window / previous)
+            end
+            retry_after = math.max(retry_after, wait)
+            remaining = math.max(0, math.floor(limit - used))
+        else
+            remaining = math.max(0, math.floor(limit - used - cost))
+        end
+        if binding_remaining == nil or remaining < binding_remaining then
+            binding, binding_remaining, binding_reset = i, remaining, reset_after
+        end
+        current_keys[i] = current_key
+        windows[i] = window
+    end
+    if allowed == 1 then
+        for i = 1, #KEYS do
+            redis.call('INCRBY', current_keys[i], cost)
+            redis.call('EXPIRE', current_keys[i], math.ceil(windows[i] * 2))
+        end
+    end
+    return {allowed, binding, binding_remaining, tostring(binding_reset), tostring(retry_after)}
+    """
+
+    # KEYS: one bucket per rule; ARGV: cost, then (limit, window) per rule
+    TOKEN_BUCKET_SCRIPT = """
+    local cost = tonumber(ARGV[1])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local allowed = 1
+    local binding, binding_remaining, binding_reset = 1, nil, 0
+    local retry_after = 0
+    local levels = {}
+    local windows = {}
+    for i = 1, #KEYS do
+        local limit = tonumber(ARGV[2 * i])
+        local window = tonumber(ARGV[2 * i + 1])
+        local rate = limit / window
+        local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or limit
+        local updated_at = tonumber(state[2]) or now
+        tokens = math.min(limit, tokens + (now - updated_at) * rate)
+        local remaining, reset_after
+        if tokens >= cost then
+            remaining = math.floor(tokens - cost)
+            reset_after = (limit - tokens + cost) / rate
+        else
+            allowed = 0
+            remaining = math.floor(tokens)
+            reset_after = (limit - tokens) / rate
+            retry_after = math.max(retry_after, (cost - tokens) / rate)
+        end
+        if binding_remaining == nil or remaining < binding_remaining then
+            binding, binding_remaining, binding_reset = i, remaining, reset_after
+        end
+        levels[i] = tokens
+        windows[i] = window
+    end
+    if allowed == 1 then
+        for i = 1, #KEYS do
+            redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+            redis.call('EXPIRE', KEYS[i], math.ceil(windows[i] * 2))
+        end
+    end
+    return {allowed, binding, binding_remaining, tostring(binding_reset), tostring(retry_after)}
+    """
+
+    SLIDING_WINDOW_REFUND_SCRIPT = """
+    local window = tonumber(ARGV[1])
+    local amount = tonumber(ARGV[2])
+    local offset = tonumber(ARGV[3])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local current_key = KEYS[1] .. ':' .. math.floor((now - offset) / window)
+    local refund = math.min(tonumber(redis.call('GET', current_key) or '0'), amount)
+    if refund > 0 then
+        redis.call('DECRBY', current_key, refund)
+    end
+    return refund
+    """
+
+    TOKEN_BUCKET_REFUND_SCRIPT = """
+    local limit = tonumber(ARGV[1])
+    local amount = tonumber(ARGV[2])
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+    if tokens == nil then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(limit, tokens + amount)))
+    return amount
+    """
+
+    # Concurrency slots are members of a sorted set scored by lease expiry
+    ACQUIRE_SLOT_SCRIPT = """
+    local limit = tonumber(ARGV[1])
+    local ttl = tonumber(ARGV[2])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    if redis.call('ZCARD', KEYS[1]) >= limit then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], now + ttl, ARGV[3])
+    redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+    return 1
+    """
+
+    def __init__(self, client=None, url=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(
+                url or get_rate_limit_setting('REDIS_URL', 'redis://localhost:6379/1')
+            )
+        self.client = client
+        self._sliding_window = client.register_script(self.SLIDING_WINDOW_SCRIPT)
+        self._token_bucket = client.register_script(self.TOKEN_BUCKET_SCRIPT)
+        self._sliding_window_refund = client.register_script(self.SLIDING_WINDOW_REFUND_SCRIPT)
+        self._token_bucket_refund = client.register_script(self.TOKEN_BUCKET_REFUND_SCRIPT)
+        self._acquire_slot = client.register_script(self.ACQUIRE_SLOT_SCRIPT)
+
+    def _result(self, rules, raw):
+        allowed, binding, remaining, reset_after, retry_after = raw
+        return RateLimitResult(
+            bool(allowed), rules[int(binding) - 1].limit, int(remaining),
+            float(reset_after), float(retry_after)
+        )
+
+    def sliding_window(self, key, limit, window, cost=1):
+        return self.sliding_window_many([RateLimitRule(key, limit, window)], cost)
+
+    def token_bucket(self, key, limit, window, cost=1):
+        return self.token_bucket_many([RateLimitRule(key, limit, window)], cost)
+
+    def sliding_window_many(self, rules, cost=1):
+        args = [cost]
+        for rule in rules:
+            args.extend([rule.limit, rule.window, window_offset(rule.key, rule.window)])
+        raw = self._sliding_window(
+            keys=[f"{self.KEY_PREFIX}:sw:{rule.key}" for rule in rules],
+            args=args
+        )
+        return self._result(rules, raw)
+
+    def token_bucket_many(self, rules, cost=1):
+        args = [cost]
+        for rule in rules:
+            args.extend([rule.limit, rule.window])
+        raw = self._token_bucket(
+            keys=[f"{self.KEY_PREFIX}:tb:{rule.key}" for rule in rules],
+            args=args
+        )
+        return self._result(rules, raw)
+
+    def sliding_window_refund(self, key, limit, window, amount):
+        return int(self._sliding_window_refund(
+            keys=[f"{self.KEY_PREFIX}:sw:{key}"],
+            args=[window, amount, window_offset(key, window)]
+        ))
+
+    def token_bucket_refund(self, key, limit, window, amount):
+        return int(self._token_bucket_refund(
+            keys=[f"{self.KEY_PREFIX}:tb:{key}"],
+            args=[limit, amount]
+        ))
+
+    def acquire_slot(self, key, limit, ttl, token):
+        return bool(self._acquire_slot(
+            keys=[f"{self.KEY_PREFIX}:cc:{key}"],
+            args=[limit, ttl, token]
+        ))
+
+    def release_slot(self, key, token):
+        self.client.zrem(f"{self.KEY_PREFIX}:cc:{key}", token)
+
+
+class RateLimiter:
+    """
+    Front end that binds a backend to an algorithm and default window.
+    """
+
+    ALGORITHMS = (SLIDING_WINDOW, TOKEN_BUCKET)
+
+    def __init__(self, backend, algorithm=SLIDING_WINDOW, window=3600):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+        self.backend = backend
+        self.algorithm = algorithm
+        self.window = window
+
+    def hit(self, key, limit, cost=1, window=None):
+        """Charge ``cost`` units against ``key`` and return the decision"""
+        return getattr(self.backend, self.algorithm)(
+            key, limit, window or self.window, cost
+        )
+
+    def hit_many(self, rules, cost=1):
+        """
+        Evaluate several rules in one atomic pass. Nothing is charged unless
+        every rule allows the request.
+        """
+        return getattr(self.backend, f"{self.algorithm}_many")(rules, cost)
+
+    def refund(self, key, limit, amount, window=None):
+        """Give back ``amount`` units charged in the current window"""
+        return getattr(self.backend, f"{self.algorithm}_refund")(
+            key, limit, window or self.window, amount
+        )
+
+    def acquire_slot(self, key, limit, ttl):
+        """
+        Take one of ``limit`` concurrency slots for ``key``. Returns a token
+        to pass to release_slot, or None when all slots are taken. Slots
+        expire after ``ttl`` seconds in case a worker dies holding one.
+        """
+        token = secrets.token_hex(8)
+        if self.backend.acquire_slot(key, limit, ttl, token):
+            return token
+        return None
+
+    def release_slot(self, key, token):
+        self.backend.release_slot(key, token)
+
+    def release(self):
+        """Hook for limiters that hold quota locally; nothing to do here"""
+
+
+class QuotaLease:
+    """Block of tokens reserved from the shared store for one key"""
+
+    __slots__ = ('limit', 'tokens', 'shared_remaining', 'expires_at', 'window_ends_at')
+
+    def __init__(self, limit, tokens, result, ttl):
+        now = time.time()
+        self.limit = limit
+        self.tokens = tokens
+        self.shared_remaining = result.remaining
+        self.window_ends_at = now + result.reset_after
+        self.expires_at = min(now + ttl, self.window_ends_at)
+
+
+class LeasingRateLimiter(RateLimiter):
+    """
+    Rate limiter that reserves blocks of ``lease_size`` tokens from the
+    shared store and spends them locally, so a busy key only touches the
+    shared store once per block.
+
+    Leased tokens are already charged to the shared counter, so the
+    configured limit is never exceeded. Unused tokens are refunded once the
+    lease expires, whether or not its key is used again: every ``hit``
+    sweeps expired leases at most once per second, and a daemon thread
+    sweeps every ``lease_ttl`` seconds while leases are outstanding, so an
+    idle worker refunds too. Leases are also returned when the worker shuts
+    down. A refund is skipped if the window has rolled over, since the
+    charge has aged out by then. At most ``workers * lease_size`` tokens
+    can sit unused in other workers, for roughly ``lease_ttl`` seconds.
+    Keys whose limit is below ``min_limit`` bypass leasing.
+    """
+
+    # Minimum seconds between sweeps triggered by hit()
+    SWEEP_INTERVAL = 1
+
+    def __init__(self, backend, algorithm=SLIDING_WINDOW, window=3600,
+                 lease_size=50, lease_ttl=10, min_limit=10000):
+        super().__init__(backend, algorithm, window)
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.min_limit = min_limit
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self._sweeper = None
+
+    def hit(self, key, limit, cost=1, window=None):
+        if window or limit < self.min_limit or cost > self.lease_size:
+            return super().hit(key, limit, cost, window)
+
+        if time.time() >= self._next_sweep:
+            self.sweep()
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease.limit == limit and lease.expires_at > time.time():
+                if lease.tokens >= cost:
+                    lease.tokens -= cost
+                    return RateLimitResult(
+                        True, limit, lease.shared_remaining + lease.tokens,
+                        max(0, lease.window_ends_at - time.time()), 0
+                    )
+            stale = self._leases.pop(key, None)
+
+        if stale is not None:
+            self._refund_lease(key, stale)
+
+        result = super().hit(key, limit, self.lease_size)
+        granted = self.lease_size
+        if not result.allowed and cost <= result.remaining < self.lease_size:
+            # Near the end of the budget take whatever is left
+            granted = result.remaining
+            result = super().hit(key, limit, granted)
+
+        if not result.allowed:
+            return super().hit(key, limit, cost)
+
+        lease = QuotaLease(limit, granted - cost, result, self.lease_ttl)
+        with self._lock:
+            previous = self._leases.get(key)
+            self._leases[key] = lease
+            if self._sweeper is None or not self._sweeper.is_alive():
+                self._sweeper = threading.Thread(target=self._sweep_loop, name='rate-limit-lease-sweeper', daemon=True)
+                self._sweeper.start()
+
+        if previous is not None:
+            self._refund_lease(key, previous)
+
+        return RateLimitResult(
+            True, limit, result.remaining + lease.tokens, result.reset_after, 0
+        )
+
+    def hit_many(self, rules, cost=1):
+        # Leases only make sense for a single counter; combined checks go
+        # straight to the shared store
+        if len(rules) == 1:
+            rule = rules[0]
+            return self.hit(rule.key, rule.limit, cost, None if rule.window == self.window else rule.window)
+        return super().hit_many(rules, cost)
+
+    def _refund_lease(self, key, lease):
+        if lease.tokens > 0 and time.time() < lease.window_ends_at:
+            super().refund(key, lease.limit, lease.tokens)
+
+    def sweep(self):
+        """Refund every expired lease, whichever key it belongs to"""
+        now = time.time()
+        with self._lock:
+            self._next_sweep = now + self.SWEEP_INTERVAL
+            expired = [(key, lease) for key, lease in self._leases.items() if lease.expires_at <= now]
+            for key, _ in expired:
+                del self._leases[key]
+
+        for key, lease in expired:
+            try:
+                self._refund_lease(key, lease)
+            except Exception as e:
+                logger.warning(f"Failed to return leased quota for {key}: {e}")
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.lease_ttl)
+            self.sweep()
+            with self._lock:
+                if not self._leases:
+                    # Restarted by the next lease
+                    self._sweeper = None
+                    return
+
+    def release(self):
+        """Return every outstanding lease to the shared store"""
+        with self._lock:
+            leases, self._leases = self._leases, {}
+
+        for key, lease in leases.items():
+            try:
+                self._refund_lease(key, lease)
+            except Exception as e:
+                logger.warning(f"Failed to return leased quota for {key}: {e}")
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter configured in settings"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                backend_class = import_string(get_rate_limit_setting(
+                    'BACKEND', 'users.rate_limiting.LocalRateLimitBackend'
+                ))
+                options = {
+                    'algorithm': get_rate_limit_setting('ALGORITHM', SLIDING_WINDOW),
+                    'window': get_rate_limit_setting('WINDOW', 3600),
+                }
+                lease_size = get_rate_limit_setting('LEASE_SIZE', 0)
+                if lease_size:
+                    _rate_limiter = LeasingRateLimiter(
+                        backend_class(),
+                        lease_size=lease_size,
+                        lease_ttl=get_rate_limit_setting('LEASE_TTL', 10),
+                        min_limit=get_rate_limit_setting('LEASE_MIN_LIMIT', 10000),
+                        **options
+                    )
+                    # Hand unused leased quota back when the worker exits
+                    atexit.register(_rate_limiter.release)
+                else:
+                    _rate_limiter = RateLimiter(backend_class(), **options)
+    return _rate_limiter
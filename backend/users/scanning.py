@@ -0,0 +1,265 @@
+"""
+Single-pass scanner for suspicious request content.
+
+``screen_content`` rejects control characters and over-long values with
+C-speed primitives and works on raw UTF-8 bytes as well as str, so request
+bodies can be screened before they are decoded.
+
+Each rule pairs a full regex with the literal trigger tokens that any match
+must contain. A scan lowercases the input once and checks the triggers with
+C-speed substring search. Only rules whose trigger is present run their
+regex, so clean input (the common case) never reaches the regex engine.
+
+Rules whose regex joins tokens with unbounded gaps (``.*``, ``[^>]*``) can
+backtrack quadratically or worse on crafted input. Those rules carry a
+TokenSequence matcher that accepts exactly the same strings in linear time,
+and the scanner runs it instead of the regex.
+"""
+
+import heapq
+import re
+from collections import deque, namedtuple
+
+ScanRule = namedtuple('ScanRule', ['name', 'pattern', 'triggers', 'matcher'])
+ScanRule.__new__.__defaults__ = (None,)
+
+# 10KB limit for individual values
+MAX_VALUE_LENGTH = 10000
+
+# Control characters other than tab, newline and carriage return. In UTF-8
+# these bytes never occur inside a multi-byte sequence, so checking the
+# undecoded body is exact. bytes.translate deletes them several times faster
+# than a regex search can walk a clean body.
+CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+CONTROL_BYTES = bytes([b for b in range(32) if b not in b'\t\n\r'])
+
+# Deleting continuation bytes leaves one byte per encoded character
+UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xc0))
+
+# Non-ASCII characters that re.IGNORECASE treats as equal to an ASCII
+# letter. Folding them keeps the trigger stage a strict superset of the
+# regex stage.
+IGNORECASE_FOLDS = str.maketrans({
+    'İ': 'i',  # LATIN CAPITAL LETTER I WITH DOT ABOVE
+    'ı': 'i',  # LATIN SMALL LETTER DOTLESS I
+    'ſ': 's',  # LATIN SMALL LETTER LONG S
+    'K': 'k',  # KELVIN SIGN
+})
+
+
+def fold_case(text):
+    """Lowercase text the way the trigger stage compares it"""
+    if not text.isascii():
+        text = text.translate(IGNORECASE_FOLDS)
+    return text.lower()
+
+
+def screen_content(content, max_length=MAX_VALUE_LENGTH):
+    """
+    Return 'control_characters' or 'too_long' if content fails the bulk
+    screen, otherwise None. Accepts str or UTF-8 encoded bytes.
+    """
+    if isinstance(content, bytes):
+        if len(content.translate(None, CONTROL_BYTES)) != len(content):
+            return 'control_characters'
+        length = len(content)
+        if length > max_length and not content.isascii():
+            length = len(content.translate(None, UTF8_CONTINUATION_BYTES))
+    else:
+        if CONTROL_CHARACTERS.search(content):
+            return 'control_characters'
+        length = len(content)
+
+    if length > max_length:
+        return 'too_long'
+    return None
+
+
+# Gap specs for TokenSequence: characters a gap may not contain
+ANY = ''           # .* with DOTALL
+SAME_LINE = '\n'   # .* without DOTALL
+
+
+def _events(pattern, text, pos, kind, index):
+    """Yield every match at or after pos, overlapping ones included"""
+    match = pattern.search(text, pos)
+    while match:
+        yield match.start(), kind, index, match.end()
+        match = pattern.search(text, match.start() + 1)
+
+
+_TOKEN = 0
+_BLOCKER = 1
+
+
+class TokenSequence:
+    """
+    Linear-time matcher for regexes of the form ``T1 G1 T2 G2 ... Tn``.
+
+    Each token Ti is a regex whose matches cannot contain one another, and
+    each gap Gi is a run of characters excluding a fixed set: SAME_LINE for
+    ``.*``, ANY for ``(?s).*``, or e.g. '>' for ``[^>]*``.
+
+    ``search`` makes one left-to-right sweep over the token matches and the
+    forbidden gap characters, merged by position. For each level it keeps
+    the latest end of a valid chain T1..Ti; a Ti+1 match extends the chain
+    if such an end lies before it with no forbidden character in between.
+    Every match and blocker is visited once, so the cost is linear in the
+    length of the text however it is crafted.
+    """
+
+    def __init__(self, *items, flags=0):
+        self.tokens = [re.compile(token, flags) for token in items[::2]]
+        self.gaps = [
+            re.compile('[' + re.escape(forbidden) + ']') if forbidden else None
+            for forbidden in items[1::2]
+        ]
+
+    def search(self, text):
+        last = len(self.tokens) - 1
+
+        # Ends of valid chains per level, oldest first, and the position of
+        # the latest forbidden character seen per gap
+        ends = [deque() for _ in range(last)]
+        blocked = [-1] * last
+
+        # Streams are merged by position. A level's token and blocker
+        # streams only start once the level before it has a valid chain,
+        # so text that never gets past the first token is searched once.
+        heap = []
+
+        def start_stream(pattern, pos, kind, index):
+            stream = _events(pattern, text, pos, kind, index)
+            event = next(stream, None)
+            if event is not None:
+                heapq.heappush(heap, (event, stream))
+
+        start_stream(self.tokens[0], 0, _TOKEN, 0)
+        while heap:
+            (start, kind, index, end), stream = heap[0]
+            event = next(stream, None)
+            if event is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (event, stream))
+
+            if kind == _BLOCKER:
+                blocked[index] = start
+                continue
+
+            if index:
+                # Only the latest chain end before this token matters
+                previous = ends[index - 1]
+                while len(previous) > 1 and previous[1] <= start:
+                    previous.popleft()
+                if previous[0] > start or blocked[index - 1] >= previous[0]:
+                    continue
+
+            if index == last:
+                return True
+
+            if not ends[index]:
+                start_stream(self.tokens[index + 1], end, _TOKEN, index + 1)
+                if self.gaps[index]:
+                    start_stream(self.gaps[index], end, _BLOCKER, index)
+            ends[index].append(end)
+
+        return False
+
+
+# Suspicious patterns to detect potential attacks (refined for fewer false positives)
+SUSPICIOUS_RULES = [
+    # SQL Injection patterns (more specific)
+    ScanRule(
+        'sql_union_select', re.compile(r'\bunion\s+select\b.*\bfrom\b', re.IGNORECASE), ('union',),
+        TokenSequence(r'\bunion\s+select\b', SAME_LINE, r'\bfrom\b', flags=re.IGNORECASE)
+    ),
+    ScanRule('sql_drop_table', re.compile(r'\bdrop\s+table\b', re.IGNORECASE), ('drop',)),
+    ScanRule(
+        'sql_delete_from', re.compile(r'\bdelete\s+from\b.*\bwhere\b.*[\'"].*[\'"]', re.IGNORECASE), ('delete',),
+        TokenSequence(r'\bdelete\s+from\b', SAME_LINE, r'\bwhere\b', SAME_LINE, r'[\'"]', SAME_LINE, r'[\'"]',
+                      flags=re.IGNORECASE)
+    ),
+    ScanRule(
+        'sql_insert_into', re.compile(r'\binsert\s+into\b.*\bvalues\b.*\([^)]*[\'"][^\'")]*[\'"][^)]*\)', re.IGNORECASE), ('insert',),
+        TokenSequence(r'\binsert\s+into\b', SAME_LINE, r'\bvalues\b', SAME_LINE, r'\(', ')', r'[\'"]', '\'")',
+                      r'[\'"]', ')', r'\)', flags=re.IGNORECASE)
+    ),
+    # SQL injection with comments
+    ScanRule(
+        'sql_comment', re.compile(r'[\'"];.*--', re.IGNORECASE), ('--',),
+        TokenSequence(r'[\'"];', SAME_LINE, r'--')
+    ),
+
+    # XSS patterns (more specific)
+    ScanRule(
+        'xss_script_tag', re.compile(r'<script[^>]*>.*?</script>', re.IGNORECASE | re.DOTALL), ('</script',),
+        TokenSequence(r'<script', '>', r'>', ANY, r'</script>', flags=re.IGNORECASE)
+    ),
+    # The trailing [^;]+ only needs its first character to match
+    ScanRule(
+        'xss_javascript_uri', re.compile(r'javascript\s*:\s*[^;]+', re.IGNORECASE), ('javascript',),
+        TokenSequence(r'javascript\s*:[^;]', flags=re.IGNORECASE)
+    ),
+    ScanRule(
+        'xss_iframe', re.compile(r'<iframe[^>]*src\s*=', re.IGNORECASE), ('<iframe',),
+        TokenSequence(r'<iframe', '>', r'src\s*=', flags=re.IGNORECASE)
+    ),
+    ScanRule(
+        'xss_object', re.compile(r'<object[^>]*data\s*=', re.IGNORECASE), ('<object',),
+        TokenSequence(r'<object', '>', r'data\s*=', flags=re.IGNORECASE)
+    ),
+
+    # Path traversal patterns (more specific)
+    ScanRule('path_traversal', re.compile(r'\.\.[\\/]\.\.[\\/]\.\.[\\/]'), ('../', '..\\')),  # Multiple directory traversals
+    ScanRule('path_etc_passwd', re.compile(r'[\\/]etc[\\/]passwd'), ('etc/passwd', 'etc\\passwd')),
+    ScanRule('path_proc_self', re.compile(r'[\\/]proc[\\/]self[\\/]'), ('proc/self', 'proc\\self')),
+
+    # Command injection patterns (very specific)
+    ScanRule('cmd_injection', re.compile(r'[;&|`]\s*(rm\s+-rf|cat\s+\/etc|wget\s+http)', re.IGNORECASE), ('-rf', '/etc', 'wget')),
+    ScanRule(
+        'cmd_substitution', re.compile(r'\$\([^)]*rm[^)]*\)', re.IGNORECASE), ('$(',),
+        TokenSequence(r'\$\(', ')', r'rm', ')', r'\)', flags=re.IGNORECASE)
+    ),
+
+    # Template injection patterns (specific)
+    ScanRule(
+        'template_injection', re.compile(r'\{\{.*(__import__|eval|exec).*\}\}', re.IGNORECASE), ('{{',),
+        TokenSequence(r'\{\{', SAME_LINE, r'__import__|eval|exec', SAME_LINE, r'\}\}', flags=re.IGNORECASE)
+    ),
+]
+
+
+class ContentScanner:
+    """
+    Literal-prefilter scanner over a list of ScanRules.
+
+    ``scan`` returns the name of the first rule that matches, or None. Every
+    rule is either a bounded regex or carries a linear TokenSequence, so a
+    scan is linear in the length of the text.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+    def scan(self, text):
+        if not text:
+            return None
+
+        folded = fold_case(text)
+        for rule in self.rules:
+            for trigger in rule.triggers:
+                if trigger in folded:
+                    if self.matches(rule, text):
+                        return rule.name
+                    break
+        return None
+
+    @staticmethod
+    def matches(rule, text):
+        if rule.matcher is not None:
+            return rule.matcher.search(text)
+        return rule.pattern.search(text) is not None
+
+
+suspicious_content_scanner = ContentScanner(SUSPICIOUS_RULES)
@@ -2,17 +2,32 @@
 Security headers middleware for enhanced API security
 """
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
 class SecurityHeadersMiddleware:
     """
     Middleware to add additional security headers to all responses
     """
     
+    sync_capable = True
+    async_capable = True
+    
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
-        
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.add_headers(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(await self.get_response(request))
+
+    def add_headers(self, response):
         # Add security headers
         if not response.get('Strict-Transport-Security'):
             response['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
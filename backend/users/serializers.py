@@ -1,15 +1,45 @@
+from contextlib import contextmanager
+
 from rest_framework import serializers
+from django.conf import settings
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
 from django.utils.html import strip_tags
-from .models import User, APIKey
+from .models import User, APIKey, DUPLICATE_EMAIL_MESSAGE, USER_EMAIL_UNIQUE_CONSTRAINT
+from .timing import timed
 from .validators import (
-    sanitize_html, sanitize_sql, normalize_text,
+    NAME_SANITIZER, ADDRESS_SANITIZER, PHONE_SANITIZER, EMAIL_SANITIZER, strip_markup,
     CustomEmailValidator, NameValidator, PhoneNumberValidator,
     AddressValidator, AgeValidator, ImageValidator
 )
 import re
 import html
-import bleach
+
+
+def get_bulk_create_setting(name, default):
+    """Read a value from the BULK_CREATE_SETTINGS dict with a fallback"""
+    return getattr(settings, 'BULK_CREATE_SETTINGS', {}).get(name, default)
+
+
+def is_duplicate_email_error(exc):
+    return USER_EMAIL_UNIQUE_CONSTRAINT in str(exc)
+
+
+@contextmanager
+def translate_duplicate_email():
+    """
+    Turn a violation of the case-insensitive email index into the email
+    field's validation error. The savepoint keeps an enclosing transaction
+    usable after the failed write.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as e:
+        if not is_duplicate_email_error(e):
+            raise
+        raise serializers.ValidationError({'email': [DUPLICATE_EMAIL_MESSAGE]})
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -50,6 +80,10 @@ class UserSerializer(serializers.ModelSerializer):
             },
         }
 
+    def is_valid(self, raise_exception=False):
+        with timed('serializer'):
+            return super().is_valid(raise_exception=raise_exception)
+
     def get_profile_picture_url(self, obj):
         """Return the full URL for the profile picture"""
         if obj.profile_picture:
@@ -65,7 +99,7 @@ class UserSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Email is required.")
         
         # Sanitize and normalize
-        cleaned_email = normalize_text(value.strip().lower())
+        cleaned_email = EMAIL_SANITIZER(value.strip().lower())
         
         # Run custom validator
         validator = CustomEmailValidator()
@@ -86,9 +120,7 @@ class UserSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Name is required.")
         
         # Sanitize input
-        cleaned_name = sanitize_html(value)
-        cleaned_name = sanitize_sql(cleaned_name)
-        cleaned_name = normalize_text(cleaned_name)
+        cleaned_name = NAME_SANITIZER(value)
         
         # Run custom validator
         validator = NameValidator()
@@ -109,8 +141,7 @@ class UserSerializer(serializers.ModelSerializer):
             return value
         
         # Sanitize input
-        cleaned_phone = sanitize_html(value)
-        cleaned_phone = normalize_text(cleaned_phone)
+        cleaned_phone = PHONE_SANITIZER(value)
         
         # Run custom validator
         validator = PhoneNumberValidator()
@@ -127,9 +158,7 @@ class UserSerializer(serializers.ModelSerializer):
             return value
         
         # Sanitize input
-        cleaned_address = sanitize_html(value)
-        cleaned_address = sanitize_sql(cleaned_address)
-        cleaned_address = normalize_text(cleaned_address)
+        cleaned_address = ADDRESS_SANITIZER(value)
         
         # Run custom validator
         validator = AddressValidator()
@@ -173,14 +202,8 @@ class UserSerializer(serializers.ModelSerializer):
         # Global input sanitization
         for field_name, field_value in data.items():
             if isinstance(field_value, str):
-                # Apply HTML sanitization to all string fields
-                data[field_name] = bleach.clean(
-                    field_value,
-                    tags=[],  # No HTML tags allowed
-                    attributes={},  # No attributes allowed
-                    strip=True,  # Strip disallowed tags
-                    strip_comments=True  # Strip HTML comments
-                )
+                # Strip any HTML tags and comments from all string fields
+                data[field_name] = strip_markup(field_value)
         
         # Cross-field validation
         if 'age' in data and 'name' in data:
@@ -189,38 +212,101 @@ class UserSerializer(serializers.ModelSerializer):
                 # This is just an example - you can add your business rules here
                 pass
         
-        # Check for duplicate email
+        # Duplicate emails are caught by the unique index on save
         email = data.get('email')
         if email:
-            email = email.lower().strip()
-            data['email'] = email
-            
-            if self.instance:
-                # Update operation
-                if email != getattr(self.instance, 'email', ''):
-                    if User.objects.filter(email=email).exists():
-                        raise serializers.ValidationError({
-                            'email': 'A user with this email already exists.'
-                        })
-            else:
-                # Create operation
-                if User.objects.filter(email=email).exists():
-                    raise serializers.ValidationError({
-                        'email': 'A user with this email already exists.'
-                    })
-        
-        # Validate request size (approximate)
-        import json
-        data_size = len(json.dumps(data, default=str).encode('utf-8'))
-        max_request_size = 1024 * 1024  # 1MB
-        
-        if data_size > max_request_size:
-            raise serializers.ValidationError(
-                "Request data too large. Maximum size is 1MB."
-            )
+            data['email'] = email.lower().strip()
         
         return data
 
+    def create(self, validated_data):
+        with translate_duplicate_email():
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with translate_duplicate_email():
+            return super().update(instance, validated_data)
+
+
+class UserBulkSerializer(serializers.ListSerializer):
+    """
+    List serializer for bulk creates that keeps the valid rows when others
+    fail. Rows are validated by the UserSerializer child exactly as
+    ``many=True`` would; email conflicts, within the request and with
+    existing users, are then resolved with a single query.
+    """
+
+    def validate_rows(self):
+        """
+        Return (valid, errors), mapping row indexes to validated data and to
+        error details. Raises ValidationError if the payload is not a
+        non-empty list of at most ``max_length`` rows.
+        """
+        data = self.initial_data
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(input_type=type(data).__name__)
+            raise serializers.ValidationError({'non_field_errors': [message]}, code='not_a_list')
+        if not data:
+            raise serializers.ValidationError({'non_field_errors': [self.error_messages['empty']]}, code='empty')
+        if self.max_length is not None and len(data) > self.max_length:
+            message = self.error_messages['max_length'].format(max_length=self.max_length)
+            raise serializers.ValidationError({'non_field_errors': [message]}, code='max_length')
+
+        valid = {}
+        errors = {}
+        with timed('serializer'):
+            for index, row in enumerate(data):
+                try:
+                    valid[index] = self.child.run_validation(row)
+                except serializers.ValidationError as exc:
+                    detail = exc.detail
+                    errors[index] = detail if isinstance(detail, dict) else {'non_field_errors': detail}
+
+        self.reject_email_conflicts(valid, errors)
+        return valid, errors
+
+    def reject_email_conflicts(self, valid, errors):
+        """Move rows whose email is taken, or repeats an earlier row, to errors"""
+        emails = {data['email'] for data in valid.values()}
+        taken = set(
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=emails)
+            .values_list('email_lower', flat=True)
+        ) if emails else set()
+
+        seen = set()
+        for index, data in list(valid.items()):
+            email = data['email']
+            if email in taken:
+                message = DUPLICATE_EMAIL_MESSAGE
+            elif email in seen:
+                message = 'This email appears more than once in the request.'
+            else:
+                seen.add(email)
+                continue
+            del valid[index]
+            errors[index] = {'email': [message]}
+
+    def create(self, validated_data):
+        batch_size = get_bulk_create_setting('BATCH_SIZE', 100)
+        return User.objects.bulk_create([User(**data) for data in validated_data], batch_size=batch_size)
+
+    def save_rows(self, valid, errors):
+        """
+        Insert the valid rows and return {row index: user}. A user created
+        concurrently with the same email fails the insert; the conflicts are
+        then looked up again and the remaining rows inserted once more.
+        """
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    users = self.create(list(valid.values()))
+                return dict(zip(valid, users))
+            except IntegrityError as e:
+                if attempt or not is_duplicate_email_error(e):
+                    raise
+                self.reject_email_conflicts(valid, errors)
+
 
 class UserListSerializer(serializers.ModelSerializer):
     """Simplified serializer for list views"""
@@ -250,7 +336,7 @@ class APIKeySerializer(serializers.ModelSerializer):
         model = APIKey
         fields = [
             'id', 'key_name', 'key_prefix', 'permissions', 
-            'is_active', 'rate_limit', 'created_at', 
+            'is_active', 'rate_limit', 'max_concurrent', 'created_at', 
             'last_used', 'expires_at'
         ]
         read_only_fields = [
@@ -267,6 +353,10 @@ class APIKeySerializer(serializers.ModelSerializer):
                 'min_value': 1,
                 'max_value': 100000,
             },
+            'max_concurrent': {
+                'min_value': 0,
+                'max_value': 1000,
+            },
         }
     
     def validate_key_name(self, value):
@@ -275,9 +365,7 @@ class APIKeySerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("API key name is required.")
         
         # Sanitize input
-        cleaned_name = sanitize_html(value)
-        cleaned_name = sanitize_sql(cleaned_name)
-        cleaned_name = normalize_text(cleaned_name)
+        cleaned_name = NAME_SANITIZER(value)
         
         # Basic format validation
         if not re.match(r'^[a-zA-Z0-9\s\-_\.]+$', cleaned_name):
@@ -386,13 +474,7 @@ class APIKeySerializer(serializers.ModelSerializer):
         # Sanitize all string fields
         for field_name, field_value in data.items():
             if isinstance(field_value, str):
-                data[field_name] = bleach.clean(
-                    field_value,
-                    tags=[],
-                    attributes={},
-                    strip=True,
-                    strip_comments=True
-                )
+                data[field_name] = strip_markup(field_value)
         
         # Business logic validation
         permissions = data.get('permissions', {})
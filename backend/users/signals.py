@@ -0,0 +1,27 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import APIKey
+from .api_key_cache import api_key_cache
+from .timing import install_query_timer
+
+
+@receiver(post_save, sender=APIKey)
+@receiver(post_delete, sender=APIKey)
+def invalidate_api_key_cache(sender, instance, update_fields=None, **kwargs):
+    """Drop cached authentication data whenever an API key changes"""
+    # Usage bookkeeping does not affect how the key resolves
+    if update_fields and set(update_fields) == {'last_used'}:
+        return
+    
+    api_key_cache.invalidate(instance.key_hash)
+    
+    # A new or reactivated key must not be shadowed by an earlier failed lookup
+    if kwargs.get('signal') is post_save:
+        api_key_cache.clear_invalid(instance.key_hash, prefix=instance.key_prefix)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    """Count every query's time against the request that ran it"""
+    install_query_timer(connection)
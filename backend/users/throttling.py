@@ -0,0 +1,201 @@
+"""
+Unified request throttling.
+
+Every limit that applies to a request (API key hourly budget, anonymous
+per-IP rate, authenticated user rate, per-endpoint scope) is evaluated in a
+single batched rate limiter call, and the one decision is shared by the
+APIKeyRateLimit permission, the DRF throttle and the response headers.
+"""
+
+import math
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .models import APIKey
+from .offenders import get_client_ip
+from .rate_limiting import RateLimitRule, get_rate_limit_setting, get_rate_limiter
+from .timing import timed
+
+RATE_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Turn a DRF style rate such as '100/hour' into (requests, seconds)"""
+    if not rate:
+        return None
+    num, period = rate.split('/')
+    return int(num), RATE_PERIODS[period[0]]
+
+
+def get_rate_limit_rules(request, view):
+    """Collect every limit that applies to this request"""
+    rates = api_settings.DEFAULT_THROTTLE_RATES
+    limiter = get_rate_limiter()
+    rules = []
+
+    auth = getattr(request, 'auth', None)
+    user = getattr(request, 'user', None)
+    if isinstance(auth, APIKey):
+        identity = f"api_key:{auth.id}"
+        rules.append(RateLimitRule(identity, auth.rate_limit, limiter.window))
+    elif user is not None and user.is_authenticated:
+        identity = f"user:{user.pk}"
+        rate = parse_rate(rates.get('user'))
+        if rate:
+            rules.append(RateLimitRule(identity, *rate))
+    else:
+        # Not get_ident: X-Forwarded-For is client-controlled
+        identity = f"anon:{get_client_ip(request)}"
+        rate = parse_rate(rates.get('anon'))
+        if rate:
+            rules.append(RateLimitRule(identity, *rate))
+
+    scope = getattr(view, 'throttle_scope', None)
+    rate = parse_rate(rates.get(scope)) if scope else None
+    if rate:
+        rules.append(RateLimitRule(f"scope:{scope}:{identity}", *rate))
+
+    return rules
+
+
+def get_request_cost(request, view):
+    """
+    Number of rate limit units a request consumes.
+
+    Views declare ``rate_cost`` next to ``permission_resource``, either as a
+    flat number or as a dict keyed by HTTP method (with an optional
+    'default'), or compute it in ``get_rate_cost(request)``.
+    ``rate_cost_bytes_per_unit`` adds one unit per that many bytes of
+    declared payload so large uploads pay for their size.
+    """
+    get_rate_cost = getattr(view, 'get_rate_cost', None)
+    if get_rate_cost is not None:
+        cost = get_rate_cost(request)
+    else:
+        cost = getattr(view, 'rate_cost', 1)
+        if isinstance(cost, dict):
+            cost = cost.get(request.method, cost.get('default', 1))
+
+    bytes_per_unit = getattr(view, 'rate_cost_bytes_per_unit', None)
+    if bytes_per_unit:
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        cost += content_length // bytes_per_unit
+
+    return max(1, int(cost))
+
+
+def evaluate_rate_limits(request, view, cost=None):
+    """
+    Charge the request against all applicable limits exactly once and
+    return the combined decision (None when no limit applies).
+    """
+    django_request = getattr(request, '_request', request)
+    result = getattr(django_request, 'rate_limit_result', None)
+    if result is not None:
+        return result
+
+    rules = get_rate_limit_rules(request, view)
+    if not rules:
+        return None
+
+    if cost is None:
+        cost = get_request_cost(request, view)
+
+    with timed('ratelimit'):
+        result = get_rate_limiter().hit_many(rules, cost)
+    django_request.rate_limit_result = result
+    return result
+
+
+class ConcurrencyLimitMixin:
+    """
+    View mixin that caps in-flight requests per API key at
+    ``APIKey.max_concurrent`` using a distributed semaphore.
+
+    The slot is taken after authentication, permissions and throttling, and
+    is always released when dispatch finishes. Requests over the cap fail
+    fast with a 429 instead of queueing for a worker thread.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        api_key = request.auth
+        if not isinstance(api_key, APIKey) or not api_key.max_concurrent:
+            return
+
+        key = f"api_key:{api_key.id}"
+        token = get_rate_limiter().acquire_slot(
+            key, api_key.max_concurrent,
+            get_rate_limit_setting('CONCURRENCY_LEASE_TTL', 60)
+        )
+        if token is None:
+            raise Throttled(
+                wait=1,
+                detail="Too many concurrent requests for this API key."
+            )
+        self._concurrency_slot = (key, token)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._concurrency_slot = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._concurrency_slot is not None:
+                get_rate_limiter().release_slot(*self._concurrency_slot)
+                self._concurrency_slot = None
+
+
+class RateLimitThrottle(BaseThrottle):
+    """
+    DRF throttle backed by the shared rate limiting engine. Replaces
+    AnonRateThrottle/UserRateThrottle, which kept a timestamp history per
+    identity and ran in addition to the API key limit.
+    """
+
+    def allow_request(self, request, view):
+        self.result = evaluate_rate_limits(request, view)
+        return self.result is None or self.result.allowed
+
+    def wait(self):
+        return self.result.retry_after if self.result is not None else None
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Middleware to expose the rate limit decision as X-RateLimit-* headers
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        result = getattr(request, 'rate_limit_result', None)
+        if result is not None:
+            response['X-RateLimit-Limit'] = str(result.limit)
+            response['X-RateLimit-Remaining'] = str(result.remaining)
+            response['X-RateLimit-Reset'] = str(math.ceil(result.reset_after))
+            if not result.allowed and not response.has_header('Retry-After'):
+                response['Retry-After'] = str(math.ceil(result.retry_after))
+
+        return response
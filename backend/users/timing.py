@@ -0,0 +1,225 @@
+"""
+Per-stage request timing.
+
+ServerTimingMiddleware starts a RequestTimer for every request and makes it
+current for the code that handles the request. The stages record into it
+with ``timed()``: request validation, authentication, the rate limiter round
+trip, serializer validation and rendering. DB time and query count come from
+an execute wrapper installed on every connection. Stages can overlap, e.g. a
+cache miss during authentication counts as both auth and db time.
+
+Finished requests are added to the per-view aggregates in ``view_timings``.
+Requests authenticated with an admin-scoped API key also get the breakdown
+as a Server-Timing header.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .models import APIKey, PERMISSION_ADMIN
+
+# Header order; stages that did not run are left out
+STAGES = ('validation', 'auth', 'ratelimit', 'serializer', 'db', 'render', 'total')
+
+# Any token is a valid HTTP method, so keys and labels built from request
+# methods use these and lump everything else together
+KNOWN_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+OTHER_METHOD = 'other'
+
+_current_timer = ContextVar('request_timer', default=None)
+
+
+def normalize_method(method):
+    """The request method, or OTHER_METHOD for anything non-standard"""
+    return method if method in KNOWN_METHODS else OTHER_METHOD
+
+
+class RequestTimer:
+    """Seconds spent per stage while handling one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.queries = 0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self):
+        self.stages['total'] = time.perf_counter() - self.started
+
+    def header(self):
+        """Format the stages as a Server-Timing header value"""
+        entries = []
+        for stage in STAGES:
+            if stage not in self.stages:
+                continue
+            entry = f"{stage};dur={self.stages[stage] * 1000:.2f}"
+            if stage == 'db':
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        return ', '.join(entries)
+
+
+def current_timer():
+    """The timer of the request being handled, or None outside a request"""
+    return _current_timer.get()
+
+
+@contextmanager
+def timed(stage):
+    """Add the time spent in the block to the current request's stage"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query's time to the current request"""
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.add('db', time.perf_counter() - started)
+        timer.queries += 1
+
+
+def install_query_timer(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def is_admin_key(api_key):
+    """Timings reveal backend internals, so only admin-scoped keys see them"""
+    return isinstance(api_key, APIKey) and any(
+        mask & PERMISSION_ADMIN for mask in api_key.permission_masks.values()
+    )
+
+
+class ViewTimings:
+    """
+    Running per-view stage totals, kept in process memory.
+
+    Each worker process aggregates only the requests it served.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view, timer):
+        with self._lock:
+            entry = self._views.get(view)
+            if entry is None:
+                entry = self._views[view] = {'count': 0, 'queries': 0, 'stages': {}}
+            entry['count'] += 1
+            entry['queries'] += timer.queries
+            for stage, seconds in timer.stages.items():
+                total, slowest = entry['stages'].get(stage, (0.0, 0.0))
+                entry['stages'][stage] = (total + seconds, max(slowest, seconds))
+
+    def snapshot(self):
+        """Return {view: {'count', 'avg_queries', 'stages': {stage: {'avg_ms', 'max_ms'}}}}"""
+        with self._lock:
+            return {
+                view: {
+                    'count': entry['count'],
+                    'avg_queries': entry['queries'] / entry['count'],
+                    'stages': {
+                        stage: {
+                            'avg_ms': total * 1000 / entry['count'],
+                            'max_ms': slowest * 1000,
+                        }
+                        for stage, (total, slowest) in entry['stages'].items()
+                    },
+                }
+                for view, entry in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_timings = ViewTimings()
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware that times each request's stages, aggregates them per view
+    and exposes them to admin-scoped API keys as a Server-Timing header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Keep the async handler from running the hook in a thread
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.finish(request, response, timer)
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.finish(request, response, timer)
+
+    def process_template_response(self, request, response):
+        return self.time_render(response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.time_render(response)
+
+    def time_render(self, response):
+        """Time the deferred rendering of DRF and template responses"""
+        timer = _current_timer.get()
+        if timer is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: timer.add('render', time.perf_counter() - started)
+            )
+        return response
+
+    def finish(self, request, response, timer):
+        timer.finish()
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            view_timings.add(f"{normalize_method(request.method)} {match.view_name}", timer)
+
+        if is_admin_key(getattr(request, 'auth', None)):
+            response['Server-Timing'] = timer.header()
+        return response
@@ -0,0 +1,108 @@
+"""
+Streaming validation for multipart uploads.
+
+Every file part is written straight to a temporary file as it arrives,
+never buffered in memory, while the handler hashes it, sniffs its type from
+the first bytes and counts its size. Limits are enforced on the bytes
+actually received, not on the Content-Length header, so an upload is cut
+off as soon as it crosses a limit.
+"""
+
+import hashlib
+
+import magic
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+def get_upload_setting(name, default):
+    """Read a value from the UPLOAD_SETTINGS dict with a fallback"""
+    return getattr(settings, 'UPLOAD_SETTINGS', {}).get(name, default)
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'upload_too_large'
+
+
+class UploadRejected(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Uploaded file type is not allowed.'
+    default_code = 'upload_rejected'
+
+
+class StreamingValidationUploadHandler(FileUploadHandler):
+    """
+    Upload handler that streams each file to disk while validating it.
+
+    Completed files carry ``sha256`` (hex digest) and ``sniffed_content_type``
+    (detected from the content, not the client's claim) attributes.
+    """
+
+    # Bytes of each file handed to libmagic
+    SNIFF_BYTES = 2048
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_file_size = get_upload_setting('MAX_FILE_SIZE', 5 * 1024 * 1024)
+        self.max_total_size = get_upload_setting('MAX_TOTAL_SIZE', 10 * 1024 * 1024)
+        self.allowed_types = get_upload_setting(
+            'ALLOWED_MIME_TYPES', ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
+        )
+        self.total_size = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.file_size = 0
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.sniffed_content_type = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_size += len(raw_data)
+        self.total_size += len(raw_data)
+        if self.file_size > self.max_file_size:
+            self._abort(UploadTooLarge(f'Uploaded file is too large. Maximum size is {self.max_file_size} bytes.'))
+        if self.total_size > self.max_total_size:
+            self._abort(UploadTooLarge(f'Uploaded files are too large. Maximum total size is {self.max_total_size} bytes.'))
+
+        if self.sniffed_content_type is None:
+            self.head += raw_data[:self.SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= self.SNIFF_BYTES:
+                self._sniff()
+
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.sniffed_content_type is None:
+            self._sniff()
+
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        self.file.sniffed_content_type = self.sniffed_content_type
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+    def _sniff(self):
+        self.sniffed_content_type = magic.from_buffer(self.head, mime=True)
+        if self.sniffed_content_type not in self.allowed_types:
+            self._abort(UploadRejected(
+                f'Uploaded file type is not allowed. File appears to be: {self.sniffed_content_type}'
+            ))
+
+    def _abort(self, exc):
+        # Closing a TemporaryUploadedFile deletes it from disk
+        self.file.close()
+        raise exc
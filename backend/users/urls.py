@@ -1,11 +1,22 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'users'
 
+if settings.ASYNC_VIEWS:
+    from . import async_views
+    user_list_create = async_views.user_list_create
+    user_detail = async_views.user_detail
+else:
+    user_list_create = views.UserListCreateView.as_view()
+    user_detail = views.UserDetailView.as_view()
+
 urlpatterns = [
-    path('', views.UserListCreateView.as_view(), name='user-list-create'),
-    path('<int:pk>/', views.UserDetailView.as_view(), name='user-detail'),
+    path('', user_list_create, name='user-list-create'),
+    path('<int:pk>/', user_detail, name='user-detail'),
+    path('bulk/', views.UserBulkCreateView.as_view(), name='user-bulk-create'),
     path('api-key/info/', views.api_key_info, name='api-key-info'),
     path('api-key/validate/', views.validate_api_key, name='api-key-validate'),
+    path('timing/', views.timing_stats, name='timing-stats'),
 ]
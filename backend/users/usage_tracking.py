@@ -0,0 +1,103 @@
+"""
+Write-behind buffering of API key usage timestamps
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.db import DatabaseError, connection
+from django.db.models import Case, DateTimeField, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .api_key_cache import get_api_key_setting
+
+logger = logging.getLogger(__name__)
+
+
+class LastUsedBuffer:
+    """
+    Collects the latest ``last_used`` timestamp per API key in memory and
+    writes them back with a single bulk UPDATE every flush interval.
+
+    ``API_KEY_SETTINGS['LAST_USED_FLUSH_INTERVAL']`` controls how stale the
+    stored value may get; 0 writes every request through immediately. While
+    stamps are pending a daemon thread flushes them on schedule, so a worker
+    that goes idle does not hold them until it exits.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = None
+
+    @property
+    def flush_interval(self):
+        return get_api_key_setting('LAST_USED_FLUSH_INTERVAL', 60)
+
+    def record(self, api_key_id, timestamp):
+        """Remember that a key was used; flush if the interval has elapsed"""
+        with self._lock:
+            current = self._pending.get(api_key_id)
+            if current is None or timestamp > current:
+                self._pending[api_key_id] = timestamp
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if not due and (self._flusher is None or not self._flusher.is_alive()):
+                self._flusher = threading.Thread(target=self._flush_loop, name='api-key-last-used-flusher', daemon=True)
+                self._flusher.start()
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered timestamps with one UPDATE statement"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        from .models import APIKey
+
+        # Never move a timestamp backwards if another worker flushed a newer one
+        whens = [
+            When(pk=pk, then=Greatest(Coalesce('last_used', Value(ts)), Value(ts)))
+            for pk, ts in pending.items()
+        ]
+        try:
+            return APIKey.objects.filter(pk__in=pending.keys()).update(
+                last_used=Case(*whens, output_field=DateTimeField())
+            )
+        except DatabaseError as e:
+            logger.warning(f"Failed to flush API key usage timestamps: {e}")
+            with self._lock:
+                for pk, ts in pending.items():
+                    current = self._pending.get(pk)
+                    if current is None or ts > current:
+                        self._pending[pk] = ts
+            return 0
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    # Restarted by the next record
+                    self._flusher = None
+                    return
+                delay = self._last_flush + self.flush_interval - time.monotonic()
+
+            if delay > 0:
+                time.sleep(delay)
+                continue
+            self.flush()
+            # Don't leave this thread's connection open while it sleeps
+            connection.close()
+
+
+last_used_buffer = LastUsedBuffer()
+
+# Flush whatever is left when the worker shuts down
+atexit.register(last_used_buffer.flush)
@@ -1,18 +1,24 @@
+import html
 import re
 import string
+import threading
 import unicodedata
+from collections import namedtuple
 from django.core.exceptions import ValidationError
 from django.core.validators import EmailValidator as DjangoEmailValidator
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+import bleach
 import magic
 import os
 
+from .blocklist import DomainBlocklist
+
 
 class CustomEmailValidator(DjangoEmailValidator):
     """Enhanced email validator with additional security checks"""
     
-    # Blocked domains for security (you can add more)
+    # Blocked domains for security, on top of the EMAIL_BLOCKLIST_SETTINGS file
     BLOCKED_DOMAINS = [
         'tempmail.org',
         '10minutemail.com',
@@ -21,10 +27,13 @@ class CustomEmailValidator(DjangoEmailValidator):
     ]
     
     # Allowed TLDs (add more as needed)
-    ALLOWED_TLDS = [
+    ALLOWED_TLDS = frozenset([
         'com', 'org', 'net', 'edu', 'gov', 'co', 'io', 'ai',
         'us', 'uk', 'ca', 'au', 'de', 'fr', 'jp', 'br', 'in'
-    ]
+    ])
+    
+    # Also matches subdomains of blocked domains
+    blocklist = DomainBlocklist(BLOCKED_DOMAINS)
     
     def __call__(self, value):
         # First, run the standard Django email validation
@@ -38,7 +47,7 @@ class CustomEmailValidator(DjangoEmailValidator):
         local_part, domain = email_lower.rsplit('@', 1)
         
         # Check for blocked domains
-        if domain in self.BLOCKED_DOMAINS:
+        if domain in self.blocklist:
             raise ValidationError(
                 _('Email from this domain is not allowed.'),
                 code='blocked_domain'
@@ -46,7 +55,7 @@ class CustomEmailValidator(DjangoEmailValidator):
         
         # Check TLD
         if '.' in domain:
-            tld = domain.split('.')[-1]
+            tld = domain.rsplit('.', 1)[1]
             if tld not in self.ALLOWED_TLDS:
                 raise ValidationError(
                     _('Email domain TLD is not supported.'),
@@ -322,6 +331,79 @@ class ImageValidator:
         # using PIL/Pillow if needed
 
 
+JSONLimits = namedtuple('JSONLimits', [
+    'max_depth', 'max_keys', 'max_array_length', 'max_key_length',
+    'max_string_length', 'max_nodes', 'max_chars',
+])
+JSONLimits.__new__.__defaults__ = (10, 100, 1000, 100, 1000, 10000, 1024 * 1024)
+
+
+def check_json_structure(data, limits=JSONLimits(), scan=None):
+    """
+    Validate parsed JSON against per-node limits and a global budget.
+    
+    Walks the structure with an explicit stack, so nesting depth costs no
+    Python recursion. ``max_nodes`` caps the total number of values and
+    ``max_chars`` the total length of keys and strings; both are charged
+    before a container's children are queued, so oversized payloads are
+    rejected without being walked. ``scan`` is an optional callable run on
+    every key and string that returns a truthy value for harmful content.
+    Raises ValueError on the first limit crossed.
+    """
+    nodes = 1
+    chars = 0
+    stack = [(data, 0)]
+    
+    while stack:
+        obj, depth = stack.pop()
+        
+        if isinstance(obj, dict):
+            children = obj.values()
+            if len(obj) > limits.max_keys:
+                raise ValueError(f'Too many keys in JSON object (max {limits.max_keys})')
+            
+            for key in obj:
+                if not isinstance(key, str) or len(key) > limits.max_key_length:
+                    raise ValueError(f'JSON keys must be strings with max {limits.max_key_length} characters')
+                
+                chars += len(key)
+                if chars > limits.max_chars:
+                    raise ValueError(f'JSON text too large (max {limits.max_chars} characters)')
+                
+                if scan and scan(key):
+                    raise ValueError('JSON contains potentially harmful content')
+        
+        elif isinstance(obj, list):
+            children = obj
+            if len(obj) > limits.max_array_length:
+                raise ValueError(f'JSON array too large (max {limits.max_array_length} items)')
+        
+        else:
+            if isinstance(obj, str):
+                if len(obj) > limits.max_string_length:
+                    raise ValueError(f'JSON string value too long (max {limits.max_string_length} characters)')
+                
+                chars += len(obj)
+                if chars > limits.max_chars:
+                    raise ValueError(f'JSON text too large (max {limits.max_chars} characters)')
+                
+                if scan and scan(obj):
+                    raise ValueError('JSON contains potentially harmful content')
+            continue
+        
+        if not children:
+            continue
+        
+        if depth >= limits.max_depth:
+            raise ValueError(f'JSON structure too deep (max {limits.max_depth} levels)')
+        
+        nodes += len(children)
+        if nodes > limits.max_nodes:
+            raise ValueError(f'JSON structure too large (max {limits.max_nodes} values)')
+        
+        stack.extend((child, depth + 1) for child in children)
+
+
 class JSONFieldValidator:
     """Validator for JSON fields with size and content restrictions"""
     
@@ -329,6 +411,8 @@ class JSONFieldValidator:
     MAX_DEPTH = 10
     MAX_KEYS = 100
     
+    LIMITS = JSONLimits(max_depth=MAX_DEPTH, max_keys=MAX_KEYS, max_chars=MAX_JSON_SIZE)
+    
     def __call__(self, value):
         if not value:
             return
@@ -345,82 +429,128 @@ class JSONFieldValidator:
         
         # Check JSON depth and key count
         try:
-            self._check_json_structure(value, depth=0)
+            self._check_json_structure(value)
         except ValueError as e:
             raise ValidationError(str(e), code='invalid_json_structure')
     
-    def _check_json_structure(self, obj, depth=0):
-        if depth > self.MAX_DEPTH:
-            raise ValueError('JSON structure too deep (max 10 levels)')
-        
-        if isinstance(obj, dict):
-            if len(obj) > self.MAX_KEYS:
-                raise ValueError(f'Too many keys in JSON object (max {self.MAX_KEYS})')
-            
-            for key, value in obj.items():
-                if not isinstance(key, str) or len(key) > 100:
-                    raise ValueError('JSON keys must be strings with max 100 characters')
-                
-                self._check_json_structure(value, depth + 1)
-        
-        elif isinstance(obj, list):
-            if len(obj) > 1000:
-                raise ValueError('JSON array too large (max 1000 items)')
-            
-            for item in obj:
-                self._check_json_structure(item, depth + 1)
-        
-        elif isinstance(obj, str):
-            if len(obj) > 1000:
-                raise ValueError('JSON string value too long (max 1000 characters)')
+    def _check_json_structure(self, obj):
+        check_json_structure(obj, self.LIMITS)
 
 
 # Sanitization functions
+#
+# Each stage is precompiled and works on a str that is known to be non-empty;
+# TextSanitizer chains the stages a field type needs into one engine.
+
+HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+# Applied one after another, so text exposed by an earlier removal is still
+# matched by the later patterns
+SQL_INJECTION_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)',
+        r'(--|/\*|\*/)',
+        r'(\bor\b.*=.*\bor\b)',
+        r'(\band\b.*=.*\band\b)',
+    )
+]
+
+# C0 and C1 control characters, removed with str.translate
+CONTROL_CHARACTER_TABLE = dict.fromkeys([*range(0x00, 0x20), *range(0x7f, 0xa0)])
+
+
+def _strip_html(text):
+    if '<' in text:
+        text = HTML_TAG_PATTERN.sub('', text)
+    return html.escape(text)
+
+
+def _strip_sql(text):
+    for pattern in SQL_INJECTION_PATTERNS:
+        text = pattern.sub('', text)
+    return text
+
+
+def _normalize(text):
+    # ASCII is already in NFKC form
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    text = text.translate(CONTROL_CHARACTER_TABLE)
+    # Same as collapsing \s+ to one space and stripping: both use str.isspace
+    return ' '.join(text.split())
+
+
+class TextSanitizer:
+    """
+    Runs a fixed sequence of sanitization stages over a value, with the
+    same result as calling the matching functions below one after another.
+    """
+
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def __call__(self, text):
+        if not text:
+            return text
+
+        text = str(text)
+        for stage in self.stages:
+            text = stage(text)
+            if not text:
+                break
+        return text
+
+
+# One engine per field type
+NAME_SANITIZER = TextSanitizer(_strip_html, _strip_sql, _normalize)
+ADDRESS_SANITIZER = TextSanitizer(_strip_html, _strip_sql, _normalize)
+PHONE_SANITIZER = TextSanitizer(_strip_html, _normalize)
+EMAIL_SANITIZER = TextSanitizer(_normalize)
+
+# Characters bleach changes in plain text: markup delimiters, CR (newlines are
+# normalized) and the C0 controls it replaces or drops. An '&' is left alone
+# only when it starts one of the entities html.escape produces.
+MARKUP_SENSITIVE_PATTERN = re.compile(
+    r'[<>\r\x00-\x08\x0b\x0c\x0e-\x1f]|&(?!(?:amp|lt|gt|quot|#x27);)'
+)
+
+_cleaners = threading.local()
+
+
+def strip_markup(text):
+    """
+    Same as bleach.clean(text, tags=[], attributes={}, strip=True,
+    strip_comments=True), without the HTML parse when bleach would return
+    the text unchanged.
+    """
+    if not MARKUP_SENSITIVE_PATTERN.search(text):
+        return text
+
+    cleaner = getattr(_cleaners, 'cleaner', None)
+    if cleaner is None:
+        # A Cleaner reuses its parser between calls, so it is per thread
+        cleaner = _cleaners.cleaner = bleach.Cleaner(
+            tags=[], attributes={}, strip=True, strip_comments=True
+        )
+    return cleaner.clean(text)
+
+
 def sanitize_html(text):
     """Remove HTML tags and encode special characters"""
     if not text:
         return text
-    
-    import html
-    # Remove HTML tags
-    clean_text = re.sub(r'<[^>]*>', '', str(text))
-    # Encode HTML entities
-    clean_text = html.escape(clean_text)
-    return clean_text
+    return _strip_html(str(text))
 
 
 def sanitize_sql(text):
     """Basic SQL injection prevention"""
     if not text:
         return text
-    
-    # Remove common SQL injection patterns
-    dangerous_patterns = [
-        r'(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)',
-        r'(--|/\*|\*/)',
-        r'(\bor\b.*=.*\bor\b)',
-        r'(\band\b.*=.*\band\b)',
-    ]
-    
-    clean_text = str(text)
-    for pattern in dangerous_patterns:
-        clean_text = re.sub(pattern, '', clean_text, flags=re.IGNORECASE)
-    
-    return clean_text
+    return _strip_sql(str(text))
 
 
 def normalize_text(text):
     """Normalize text for consistent processing"""
     if not text:
         return text
-    
-    # Unicode normalization
-    normalized = unicodedata.normalize('NFKC', str(text))
-    
-    # Remove control characters
-    normalized = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', normalized)
-    
-    # Normalize whitespace
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
-    
-    return normalized
+    return _normalize(str(text))
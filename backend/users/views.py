@@ -2,17 +2,21 @@ from django.shortcuts import render
 from django.db import models
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.exceptions import APIException, ValidationError as DRFValidationError
 from rest_framework.pagination import PageNumberPagination
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from .models import User, APIKey
-from .serializers import UserSerializer, UserListSerializer
+from .serializers import UserSerializer, UserBulkSerializer, UserListSerializer, get_bulk_create_setting
 from .permissions import HasAPIKeyPermission, APIKeyRateLimit, ResourcePermission
-from .authentication import RateLimitMixin
-from .error_utils import validation_error_response, success_response, error_response
+from .authentication import RateLimitMixin, resolve_api_key, RESOLVE_BLOCKED, RESOLVE_NOT_FOUND
+from .throttling import ConcurrencyLimitMixin
+from .offenders import get_client_ip
+from .parsers import LimitedFormParser, PreparsedJSONParser, PreparsedNDJSONParser, StreamingMultiPartParser
+from .error_utils import format_serializer_errors, validation_error_response, success_response, error_response
+from .timing import is_admin_key, view_timings
 
 
 class CustomPagination(PageNumberPagination):
@@ -31,7 +35,7 @@ class CustomPagination(PageNumberPagination):
         })
 
 
-class UserListCreateView(generics.ListCreateAPIView, RateLimitMixin):
+class UserListCreateView(ConcurrencyLimitMixin, generics.ListCreateAPIView, RateLimitMixin):
     """
     API endpoint for listing and creating users
     GET: List all users with pagination
@@ -39,10 +43,12 @@ class UserListCreateView(generics.ListCreateAPIView, RateLimitMixin):
     Requires API key authentication
     """
     queryset = User.objects.all()
-    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    parser_classes = [StreamingMultiPartParser, LimitedFormParser, PreparsedJSONParser]
     pagination_class = CustomPagination
     permission_classes = [HasAPIKeyPermission, APIKeyRateLimit]
     permission_resource = 'users'
+    rate_cost = {'GET': 1, 'POST': 5}
+    rate_cost_bytes_per_unit = 1024 * 1024  # Uploads pay one extra unit per MB
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -89,6 +95,15 @@ class UserListCreateView(generics.ListCreateAPIView, RateLimitMixin):
                         message='Validation failed',
                         errors=serializer.errors
                     )
+        except DRFValidationError as e:
+            # Raised on save when the email is taken (see translate_duplicate_email)
+            return validation_error_response(
+                message='Validation failed',
+                errors=e.detail
+            )
+        except APIException:
+            # Upload and parse errors carry their own status (e.g. 413)
+            raise
         except Exception as e:
             print(f"Exception in create: {e}")
             return error_response(
@@ -98,7 +113,7 @@ class UserListCreateView(generics.ListCreateAPIView, RateLimitMixin):
             )
 
 
-class UserDetailView(generics.RetrieveUpdateDestroyAPIView, RateLimitMixin):
+class UserDetailView(ConcurrencyLimitMixin, generics.RetrieveUpdateDestroyAPIView, RateLimitMixin):
     """
     API endpoint for retrieving, updating, and deleting a specific user
     GET: Retrieve user details
@@ -108,9 +123,11 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView, RateLimitMixin):
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    parser_classes = [StreamingMultiPartParser, LimitedFormParser, PreparsedJSONParser]
     permission_classes = [HasAPIKeyPermission, APIKeyRateLimit]
     permission_resource = 'users'
+    rate_cost = {'GET': 1, 'PUT': 5, 'PATCH': 5, 'DELETE': 2}
+    rate_cost_bytes_per_unit = 1024 * 1024  # Uploads pay one extra unit per MB
 
     def retrieve(self, request, *args, **kwargs):
         """Retrieve a specific user"""
@@ -171,6 +188,13 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView, RateLimitMixin):
                 error_details='The requested user does not exist',
                 status_code=status.HTTP_404_NOT_FOUND
             )
+        except DRFValidationError as e:
+            return validation_error_response(
+                message='Validation failed',
+                errors=e.detail
+            )
+        except APIException:
+            raise
         except Exception as e:
             return error_response(
                 message='An error occurred while updating the user',
@@ -201,6 +225,84 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView, RateLimitMixin):
             )
 
 
+class UserBulkCreateView(ConcurrencyLimitMixin, generics.GenericAPIView, RateLimitMixin):
+    """
+    API endpoint for creating many users in one request
+    POST: JSON array or NDJSON (one user per line) of up to
+          BULK_CREATE_SETTINGS['MAX_RECORDS'] users
+    Valid rows are created even when others fail; the response reports
+    the outcome of every row.
+    Requires API key authentication
+    """
+    serializer_class = UserSerializer
+    parser_classes = [PreparsedJSONParser, PreparsedNDJSONParser]
+    permission_classes = [HasAPIKeyPermission, APIKeyRateLimit]
+    permission_resource = 'users'
+    rate_cost = 5  # Per request, as for a single create
+    rate_cost_per_record = 1
+    max_body_length = None  # Screened up to INPUT_VALIDATION['MAX_DATA_SIZE']
+
+    def get_rate_cost(self, request):
+        """Charge the whole import once, weighted by its number of rows"""
+        records = request.data
+        rows = len(records) if isinstance(records, list) else 0
+        # Oversized imports are rejected whole; charge no more than the cap
+        rows = min(rows, get_bulk_create_setting('MAX_RECORDS', 500))
+        return self.rate_cost + self.rate_cost_per_record * rows
+
+    def post(self, request, *args, **kwargs):
+        serializer = UserBulkSerializer(
+            child=self.get_serializer(),
+            data=request.data,
+            max_length=get_bulk_create_setting('MAX_RECORDS', 500),
+            context=self.get_serializer_context(),
+        )
+        try:
+            valid, errors = serializer.validate_rows()
+        except DRFValidationError as e:
+            return validation_error_response(
+                message='Validation failed',
+                errors=e.detail
+            )
+
+        created = serializer.save_rows(valid, errors) if valid else {}
+
+        results = []
+        for index in range(len(request.data)):
+            if index in created:
+                results.append({
+                    'index': index,
+                    'success': True,
+                    'data': serializer.child.to_representation(created[index])
+                })
+            else:
+                results.append({
+                    'index': index,
+                    'success': False,
+                    'errors': format_serializer_errors(errors[index])
+                })
+
+        if not errors:
+            status_code = status.HTTP_201_CREATED
+        elif created:
+            status_code = status.HTTP_207_MULTI_STATUS
+        else:
+            status_code = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {
+                'success': not errors,
+                'message': f'Created {len(created)} of {len(results)} users',
+                'status_code': status_code,
+                'data': {
+                    'created': len(created),
+                    'failed': len(errors),
+                    'results': results
+                }
+            },
+            status=status_code
+        )
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_key_info(request):
@@ -221,6 +323,7 @@ def api_key_info(request):
         'key_prefix': api_key.key_prefix,
         'permissions': api_key.permissions,
         'rate_limit': api_key.rate_limit,
+        'max_concurrent': api_key.max_concurrent,
         'is_active': api_key.is_active,
         'created_at': api_key.created_at,
         'last_used': api_key.last_used,
@@ -257,28 +360,49 @@ def validate_api_key(request):
         )
     
     try:
-        prefix = api_key[:8]
-        api_key_obj = APIKey.objects.get(key_prefix=prefix, is_active=True)
+        client_ip = get_client_ip(request)
+        api_key_obj, error = resolve_api_key(api_key, client_ip)
         
-        if api_key_obj.verify_key(api_key):
+        if api_key_obj is not None:
             return Response({
                 'valid': True,
                 'key_name': api_key_obj.key_name,
                 'permissions': api_key_obj.permissions,
                 'rate_limit': api_key_obj.rate_limit,
             })
+        elif error == RESOLVE_BLOCKED:
+            return Response(
+                {'valid': False, 'error': 'Too many failed authentication attempts'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        elif error == RESOLVE_NOT_FOUND:
+            return Response(
+                {'valid': False, 'error': 'API key not found'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
         else:
             return Response(
                 {'valid': False, 'error': 'Invalid API key'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
-    except APIKey.DoesNotExist:
-        return Response(
-            {'valid': False, 'error': 'API key not found'},
-            status=status.HTTP_401_UNAUTHORIZED
-        )
     except Exception as e:
         return Response(
             {'valid': False, 'error': 'Validation error'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def timing_stats(request):
+    """
+    Per-view stage timings aggregated by this worker process.
+    Requires an admin-scoped API key.
+    """
+    if not is_admin_key(request.auth):
+        return Response(
+            {'error': 'An admin API key is required'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return Response(view_timings.snapshot())